@@ -1,3 +1,13 @@
+import os
+
+from google.appengine.ext import vendor
+
+# third-party libraries installed with pip install -t lib, see README.txt
+LIB_DIR = os.path.join(os.path.dirname(__file__), 'lib')
+if os.path.isdir(LIB_DIR):
+    vendor.add(LIB_DIR)
+
+
 def webapp_add_wsgi_middleware(app):
     from google.appengine.ext.appstats import recording
     app = recording.appstats_wsgi_middleware(app)
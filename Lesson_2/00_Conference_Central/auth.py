@@ -0,0 +1,58 @@
+#!/usr/bin/env python
+
+"""auth.py
+
+Udacity conference server-side Python App Engine request auth context
+
+"""
+
+import endpoints
+
+from utils import getUserId
+
+
+class AuthContext(object):
+    """AuthContext -- caller identity, resolved at most once per request"""
+
+    def __init__(self, authorization=None):
+        # the Authorization header this context was resolved for
+        self.authorization = authorization
+        self._resolved = False
+        self._user = None
+        self._userId = None
+        self._profile = None
+
+    def _resolve(self):
+        if not self._resolved:
+            self._user = endpoints.get_current_user()
+            if self._user:
+                self._userId = getUserId(self._user)
+            self._resolved = True
+
+    @property
+    def user(self):
+        """Current endpoints user, or None if the request is anonymous."""
+        self._resolve()
+        return self._user
+
+    @property
+    def userId(self):
+        """User id of the current user, or None if anonymous."""
+        self._resolve()
+        return self._userId
+
+    def requireUser(self):
+        """Return the current user, raising if the request is anonymous."""
+        if not self.user:
+            raise endpoints.UnauthorizedException('Authorization required')
+        return self._user
+
+    def getProfile(self, loader):
+        """Return the caller's Profile, loading it with loader() once."""
+        if self._profile is None:
+            self._profile = loader()
+        return self._profile
+
+    def setProfile(self, profile):
+        """Replace the remembered Profile, e.g. after it was written."""
+        self._profile = profile
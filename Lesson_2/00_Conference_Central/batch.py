@@ -0,0 +1,208 @@
+#!/usr/bin/env python
+
+"""batch.py
+
+Udacity conference server-side Python App Engine batch jobs; a mapper
+walks a whole kind in fixed-size batches, one batch per task, each task
+chaining the next with the query cursor. Jobs may split the kind into
+key ranges processed in parallel; their progress is kept in BatchJob and
+BatchShard entities
+
+"""
+
+import logging
+
+from google.appengine.api import taskqueue
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+from models import BatchJob
+from models import BatchShard
+
+BATCH_TASK_URL = '/tasks/batch'
+# scatter keys sampled per shard when picking the key range boundaries
+SCATTER_OVERSAMPLING = 32
+MAX_SHARDS = 24
+
+_mappers = {}
+
+
+def mapper(cls):
+    """Class decorator registering a BatchMapper under its name."""
+    _mappers[cls.name] = cls
+    return cls
+
+
+class BatchMapper(object):
+    """BatchMapper -- the work of a batch job over the results of a query
+
+    Subclasses set name, define query() and process(), and may override
+    batch_size, keys_only and finish().
+    """
+    name = None
+    batch_size = 100
+    keys_only = False
+
+    def query(self):
+        """Return the ndb.Query of the entities to process, which must be
+        of one kind and have no inequality filters or sort orders."""
+        raise NotImplementedError
+
+    def process(self, entities, totals):
+        """Process one batch; returns (entities to put, keys to delete).
+
+        totals is a dict of counters, summed over batches and shards.
+        """
+        raise NotImplementedError
+
+    def finish(self, job, totals):
+        """Called once, after every shard of job has finished."""
+        logging.info('Batch job %s (%d) done: %s', self.name,
+            job.key.id(), totals)
+
+
+def _keyRanges(query, shards):
+    """Split the keys of query into up to shards [start, end) ranges;
+    None stands for an open end."""
+    if shards > 1:
+        scatter = ndb.Query(kind=query.kind, namespace=query.namespace,
+            ancestor=query.ancestor).order(
+            ndb.GenericProperty('__scatter__')).fetch(
+            shards * SCATTER_OVERSAMPLING, keys_only=True)
+        scatter.sort()
+        step = len(scatter) / float(shards)
+        splits = sorted(set(scatter[int(i * step)]
+            for i in range(1, shards) if int(i * step) < len(scatter)))
+    else:
+        splits = []
+    bounds = [None] + splits + [None]
+    return zip(bounds[:-1], bounds[1:])
+
+
+def startBatch(name, shards=1):
+    """Create a BatchJob running mapper name over shards key ranges and
+    enqueue the task that starts its shards."""
+    if name not in _mappers:
+        raise ValueError('Unknown batch job: %s' % name)
+    shards = max(1, min(int(shards), MAX_SHARDS))
+    ranges = _keyRanges(_mappers[name]().query(), shards)
+    job_id = BatchJob.allocate_ids(size=1)[0]
+    job = BatchJob(id=job_id, name=name, shards=len(ranges))
+    job_shards = [BatchShard(id=shard_id, job=job.key, keyStart=start,
+        keyEnd=end, totals={})
+        for shard_id, (start, end) in zip(_shardIds(job), ranges)]
+
+    @ndb.transactional(xg=True)
+    def create():
+        ndb.put_multi([job] + job_shards)
+        # a transaction may add only 5 tasks, so one task fans out
+        taskqueue.add(params={'job': job_id}, url=BATCH_TASK_URL,
+            transactional=True)
+    create()
+    return job
+
+
+def startShards(job_id):
+    """Enqueue the first task of every shard of a job.
+
+    The tasks are named after their shards, so a retry adds only the
+    tasks that are missing.
+    """
+    job = BatchJob.get_by_id(job_id)
+    tasks = [taskqueue.Task(params={'shard': shard_id},
+        name='batch-%s' % shard_id, url=BATCH_TASK_URL)
+        for shard_id in _shardIds(job)]
+    try:
+        taskqueue.Queue().add(tasks)
+    except (taskqueue.TaskAlreadyExistsError, taskqueue.TombstonedTaskError):
+        pass
+
+
+def _shardIds(job):
+    return ['%d-%d' % (job.key.id(), i) for i in range(job.shards)]
+
+
+def _shardQuery(query, shard):
+    """Restrict query to the key range of shard, in key order."""
+    if shard.keyStart:
+        query = query.filter(ndb.Model._key >= shard.keyStart)
+    if shard.keyEnd:
+        query = query.filter(ndb.Model._key < shard.keyEnd)
+    return query.order(ndb.Model._key)
+
+
+def _addTotals(totals, more):
+    for name, value in more.items():
+        totals[name] = totals.get(name, 0) + value
+
+
+def runBatch(shard_id):
+    """Process the next batch of a shard, chaining its next task.
+
+    Progress is saved together with the next task, so a retried task
+    repeats at most its own batch; process() should be idempotent. A
+    duplicate run of a batch that was already saved is not saved again.
+    """
+    shard = BatchShard.get_by_id(shard_id)
+    if not shard or shard.status != 'RUNNING':
+        return shard
+    cursor = shard.cursor
+    batch_mapper = _mappers[shard.job.get().name]()
+    start_cursor = Cursor(urlsafe=shard.cursor) if shard.cursor else None
+    entities, next_cursor, more = _shardQuery(batch_mapper.query(),
+        shard).fetch_page(batch_mapper.batch_size,
+        start_cursor=start_cursor, keys_only=batch_mapper.keys_only)
+
+    totals = {}
+    to_put, to_delete = batch_mapper.process(entities, totals)
+    ndb.put_multi(to_put)
+    ndb.delete_multi(to_delete)
+    _addTotals(totals, {'processed': len(entities), 'put': len(to_put),
+        'deleted': len(to_delete)})
+    _addTotals(shard.totals, totals)
+    more = bool(more and next_cursor)
+    shard.cursor = next_cursor.urlsafe() if more else None
+    if not more:
+        shard.status = 'DONE'
+
+    @ndb.transactional(xg=True)
+    def save():
+        current = shard.key.get()
+        if current.status != 'RUNNING' or current.cursor != cursor:
+            return None
+        shard.put()
+        if more:
+            taskqueue.add(params={'shard': shard_id}, url=BATCH_TASK_URL,
+                transactional=True)
+            return None
+        job = shard.job.get()
+        job.shardsDone += 1
+        if job.shardsDone == job.shards:
+            job.status = 'DONE'
+        job.put()
+        return job
+    job = save()
+    if job and job.status == 'DONE':
+        batch_mapper.finish(job, batchStatus(job)['totals'])
+    return shard
+
+
+def batchStatus(job):
+    """Return a JSON-compatible status dict for a BatchJob, with the
+    totals summed over its shards."""
+    shards = ndb.get_multi([ndb.Key(BatchShard, shard_id)
+        for shard_id in _shardIds(job)])
+    totals = {}
+    for shard in shards:
+        if shard:
+            _addTotals(totals, shard.totals)
+    return {
+        'jobId': job.key.id(),
+        'name': job.name,
+        'status': job.status,
+        'shards': job.shards,
+        'shardsDone': job.shardsDone,
+        'totals': totals,
+        'created': job.created.isoformat(),
+        'updated': job.updated.isoformat(),
+    }
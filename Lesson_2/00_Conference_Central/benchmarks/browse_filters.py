@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+"""browse_filters.py
+
+Udacity conference server-side Python App Engine conference browser
+check; runs queryConferences with every field and operator the browse
+page offers, plus common date ranges, pages through the results and
+compares them with the conferences that match when checked one by one
+
+usage: python benchmarks/browse_filters.py [--sdk PATH] [--page-size N]
+
+"""
+
+import argparse
+from datetime import date
+from datetime import timedelta
+import os
+import sys
+
+from cold_start import setUpStubs
+
+SEED_CONFERENCES = 120
+CITIES = ['London', 'Paris', 'Tokyo', None]
+TOPICS = ['Web', 'Medical Innovations', 'Programming Languages']
+
+# the fields and operators of the browse page, static/js/controllers.js
+FIELD_VALUES = [
+    ('CITY', 'London'),
+    ('TOPIC', 'Web'),
+    ('MONTH', '6'),
+    ('MAX_ATTENDEES', '40'),
+    ('START_DATE', '2017-06-15'),
+    ('END_DATE', '2017-06-15'),
+    ('YEAR_MONTH', '2017-06'),
+    ('ISO_WEEK', '2017-W24'),
+]
+OPERATORS = ['EQ', 'GT', 'GTEQ', 'LT', 'LTEQ', 'NE']
+
+# ranges spanning one and several months and weeks, alone and together
+# with a filter on another field
+COMBINED = [
+    [('START_DATE', 'GTEQ', '2017-06-01'), ('START_DATE', 'LTEQ', '2017-06-30')],
+    [('START_DATE', 'GTEQ', '2017-05-01'), ('START_DATE', 'LTEQ', '2017-07-31')],
+    [('START_DATE', 'GTEQ', '2017-06-12'), ('START_DATE', 'LTEQ', '2017-06-18')],
+    [('START_DATE', 'GTEQ', '2017-06-05'), ('START_DATE', 'LT', '2017-07-03')],
+    [('START_DATE', 'GT', '2017-05-10'), ('START_DATE', 'LT', '2017-08-20')],
+    [('START_DATE', 'GTEQ', '2017-05-01'), ('START_DATE', 'LTEQ', '2017-07-31'),
+     ('MAX_ATTENDEES', 'GT', '40')],
+    [('START_DATE', 'GTEQ', '2017-06-01'), ('START_DATE', 'LTEQ', '2017-06-30'),
+     ('MAX_ATTENDEES', 'GT', '40')],
+    [('CITY', 'NE', 'London'), ('TOPIC', 'EQ', 'Web')],
+    [('CITY', 'NE', 'London'), ('MAX_ATTENDEES', 'LTEQ', '40')],
+    [('MAX_ATTENDEES', 'GT', '20'), ('MONTH', 'LT', '8')],
+]
+
+
+def _seed():
+    """Store conferences spread over cities, topics, sizes and dates."""
+    import validation
+    from models import Conference
+    from google.appengine.ext import ndb
+    confs = []
+    for i in range(SEED_CONFERENCES):
+        start = date(2017, 4, 1) + timedelta(days=i * 1.5)
+        data = validation.conferenceData({
+            'name': 'Conference %03d' % i,
+            'city': CITIES[i % len(CITIES)],
+            'topics': [TOPICS[i % len(TOPICS)], TOPICS[i % 2]],
+            'maxAttendees': i % 80,
+            'startDate': start.isoformat() if i % 7 else None,
+            'endDate': (start + timedelta(days=2)).isoformat(),
+        })
+        if not data['city'] or i % 11 == 0:
+            data['city'] = None
+        confs.append(Conference(**data))
+    ndb.put_multi(confs)
+    return confs
+
+
+def _expected(api, confs, request):
+    """Return the names of the conferences matching request, each
+    conference checked in memory."""
+    filters = api._parseFilters(request.filters)
+    return sorted(conf.name for conf in confs
+        if api._matchesFilters(conf, filters))
+
+
+def _pages(api, request, page_size):
+    """Return the names of all the pages of queryConferences."""
+    names = []
+    request.pageSize = page_size
+    while True:
+        response = api.queryConferences(request)
+        names.extend(conf.name for conf in response.items)
+        if not response.nextPageToken:
+            return sorted(names)
+        request.pageToken = response.nextPageToken
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--sdk', default=os.getenv('GAE_SDK',
+        '/usr/local/google_appengine'), help='App Engine SDK directory')
+    parser.add_argument('--page-size', type=int, default=7,
+        help='conferences per page')
+    args = parser.parse_args()
+
+    setUpStubs(args.sdk)
+    import conference
+    from models import QueryForm
+    from models import QueryForms
+    api = conference.ConferenceApi()
+    confs = _seed()
+
+    cases = [[(field, op, value)] for field, value in FIELD_VALUES
+        for op in OPERATORS] + COMBINED
+    failures = 0
+    for filters in cases:
+        def request():
+            return QueryForms(filters=[QueryForm(field=f, operator=o,
+                value=v) for f, o, v in filters])
+        expected = _expected(api, confs, request())
+        try:
+            got = _pages(api, request(), args.page_size)
+        except Exception as e:
+            got = '%s: %s' % (type(e).__name__, e)
+        ok = got == expected
+        failures += not ok
+        print('%-4s %-70s %d' % ('ok' if ok else 'FAIL',
+            ' '.join('%s %s %s' % f for f in filters), len(expected)))
+        if not ok:
+            print('     expected %s\n     got      %s' % (expected, got))
+    print('%d of %d filter sets failed' % (failures, len(cases)))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
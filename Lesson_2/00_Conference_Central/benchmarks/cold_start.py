@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+
+"""cold_start.py
+
+Udacity conference server-side Python App Engine cold start benchmark;
+times the first user requests of fresh instances with and without a
+warmup request, each instance simulated by a new Python process on the
+SDK's service stubs
+
+usage: python benchmarks/cold_start.py [--sdk PATH] [--runs N]
+
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SEED_CONFERENCES = 200
+
+
+def setUpStubs(sdk):
+    """Point sys.path at the SDK and activate the service stubs."""
+    sys.path.insert(0, sdk)
+    import dev_appserver
+    dev_appserver.fix_sys_path()
+    sys.path.insert(0, APP_DIR)
+    from google.appengine.ext import testbed
+    bed = testbed.Testbed()
+    bed.setup_env(current_version_id='1.1', overwrite=True)
+    bed.activate()
+    bed.init_datastore_v3_stub()
+    bed.init_memcache_stub()
+    bed.init_urlfetch_stub()
+    bed.init_taskqueue_stub(root_path=APP_DIR)
+    bed.init_app_identity_stub()
+    bed.init_user_stub()
+    return bed
+
+
+def _seed():
+    """Store some conferences without importing the app's modules."""
+    from google.appengine.ext import ndb
+    entities = []
+    for i in range(SEED_CONFERENCES):
+        entity = ndb.Expando(key=ndb.Key('Conference', i + 1))
+        entity.name = 'Conference %03d' % i
+        entity.seatsAvailable = i % 10
+        entity.maxAttendees = 10
+        entities.append(entity)
+    ndb.put_multi(entities)
+
+
+def _time(fn):
+    start = time.time()
+    fn()
+    return (time.time() - start) * 1000
+
+
+def runInstance(sdk, warm):
+    """Simulate one new instance; return its timings in milliseconds."""
+    setUpStubs(sdk)
+    _seed()
+    timings = {}
+    if warm:
+        def warmup():
+            import main
+            import webapp2
+            webapp2.Request.blank('/_ah/warmup').get_response(main.app)
+        timings['warmup'] = _time(warmup)
+
+    def index():
+        import main
+        import webapp2
+        webapp2.Request.blank('/').get_response(main.app)
+
+    def queryConferences():
+        # the method with the (de)serialization of an SPI call; the stubs
+        # have no Endpoints frontend to route /_ah/spi requests
+        from protorpc import protojson
+        from conference import ConferenceApi
+        from models import QueryForms
+        request = protojson.decode_message(QueryForms, '{}')
+        protojson.encode_message(ConferenceApi().queryConferences(request))
+
+    timings['index'] = _time(index)
+    timings['queryConferences'] = _time(queryConferences)
+    return timings
+
+
+def _median(values):
+    values = sorted(values)
+    return values[len(values) // 2]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--sdk', default=os.getenv('GAE_SDK',
+        '/usr/local/google_appengine'), help='App Engine SDK directory')
+    parser.add_argument('--runs', type=int, default=5,
+        help='instances per mode')
+    parser.add_argument('--instance', choices=['cold', 'warm'],
+        help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.instance:
+        print(json.dumps(runInstance(args.sdk, args.instance == 'warm')))
+        return
+
+    for mode in ('cold', 'warm'):
+        runs = []
+        for i in range(args.runs):
+            out = subprocess.check_output([sys.executable, __file__,
+                '--sdk', args.sdk, '--instance', mode])
+            runs.append(json.loads(out.strip().splitlines()[-1]))
+        report = ', '.join('%s %.0f ms' % (name, _median(
+            [run[name] for run in runs])) for name in sorted(runs[0]))
+        print('%-4s median of %d instances: %s' % (mode, args.runs, report))
+    print('first user requests wait only for "index" and '
+        '"queryConferences"; "warmup" runs before the instance takes them')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+
+"""query_compile.py
+
+Udacity conference server-side Python App Engine query building
+benchmark; times _getQuery and _getSessionQuery for common filter sets
+with the compiled query templates cleared before every call (each call
+parses and compiles) and kept (each call binds a cached template)
+
+usage: python benchmarks/query_compile.py [--sdk PATH] [--calls N]
+
+"""
+
+import argparse
+import os
+import timeit
+
+from cold_start import setUpStubs
+
+# (name, API method, [(field, operator, value)])
+QUERIES = [
+    ('conferences by city', '_getQuery',
+        [('CITY', 'EQ', 'London')]),
+    ('conferences by city, topic, seats', '_getQuery',
+        [('CITY', 'EQ', 'London'), ('TOPIC', 'EQ', 'Web'),
+         ('SEATS_AVAILABLE', 'GT', '0')]),
+    ('conferences in June', '_getQuery',
+        [('START_DATE', 'GTEQ', '2017-06-01'),
+         ('START_DATE', 'LTEQ', '2017-06-30')]),
+    ('sessions by type before 19:00', '_getSessionQuery',
+        [('TYPE_OF_SESSION', 'NE', 'workshop'),
+         ('START_TIME', 'LT', '1900')]),
+    ('sessions of 30-90 minutes', '_getSessionQuery',
+        [('DURATION', 'GTEQ', '30'), ('DURATION', 'LTEQ', '90')]),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[1])
+    parser.add_argument('--sdk', default=os.getenv('GAE_SDK',
+        '/usr/local/google_appengine'), help='App Engine SDK directory')
+    parser.add_argument('--calls', type=int, default=2000,
+        help='calls timed per query and mode')
+    args = parser.parse_args()
+
+    setUpStubs(args.sdk)
+    import conference
+    from models import QueryForm
+    from models import QueryForms
+    api = conference.ConferenceApi()
+
+    print('%-36s %10s %10s %8s' % ('query', 'compile', 'cached', 'speedup'))
+    for name, method, filters in QUERIES:
+        request = QueryForms(filters=[QueryForm(field=f, operator=o, value=v)
+            for f, o, v in filters])
+        build = getattr(api, method)
+
+        def compiled():
+            conference._queryTemplates.clear()
+            build(request)
+        clear = timeit.timeit(conference._queryTemplates.clear,
+            number=args.calls)
+        cold = timeit.timeit(compiled, number=args.calls) - clear
+        warm = timeit.timeit(lambda: build(request), number=args.calls)
+        print('%-36s %8.1f us %8.1f us %7.1fx' % (name,
+            cold / args.calls * 1e6, warm / args.calls * 1e6, cold / warm))
+
+
+if __name__ == '__main__':
+    main()
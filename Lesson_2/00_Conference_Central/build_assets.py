@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+
+"""build_assets.py
+
+Udacity conference server-side Python App Engine static asset build;
+concatenates and minifies the app's CSS and JavaScript into bundles named
+after their content hash and points templates/index.html at them
+
+usage: python build_assets.py
+
+"""
+
+import gzip
+import hashlib
+import io
+import os
+import re
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+DIST_DIR = os.path.join(ROOT, 'static', 'dist')
+DIST_URL = '/dist'
+INDEX_HTML = os.path.join(ROOT, 'templates', 'index.html')
+
+# bundle sources, in load order
+CSS_SOURCES = [
+    'static/bootstrap/css/bootstrap-cosmo.css',
+    'static/bootstrap/css/main.css',
+    'static/bootstrap/css/offcanvas.css',
+]
+JS_SOURCES = [
+    'static/js/app.js',
+    'static/js/controllers.js',
+]
+
+# index.html lines between these markers are replaced with the bundle tags
+MARKERS = {
+    'css': ('<!-- build:css -->', '<!-- endbuild -->',
+        '<link rel="stylesheet" href="%s">'),
+    'js': ('<!-- build:js -->', '<!-- endbuild -->',
+        '<script src="%s"></script>'),
+}
+
+# a '/' after one of these starts a regular expression, not a division
+REGEX_PRECEDERS = set('(,=:[!&|?{};+-*%<>~^') | set([''])
+
+
+def _read(path):
+    with io.open(os.path.join(ROOT, path), encoding='utf-8') as f:
+        return f.read()
+
+
+def _skipString(text, i):
+    """Return the index just past the quoted string starting at text[i]."""
+    quote = text[i]
+    i += 1
+    while i < len(text) and text[i] != quote:
+        i += 2 if text[i] == '\\' else 1
+    return i + 1
+
+
+def minifyCss(text):
+    """Strip comments and redundant whitespace from a stylesheet."""
+    # quoted strings are swapped for placeholders while whitespace is
+    # collapsed, then put back unchanged
+    strings = []
+    code = []
+    i = 0
+    while i < len(text):
+        if text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            i = len(text) if end < 0 else end + 2
+            code.append(' ')
+        elif text[i] in '"\'':
+            end = _skipString(text, i)
+            code.append('\0%d\0' % len(strings))
+            strings.append(text[i:end])
+            i = end
+        else:
+            code.append(text[i])
+            i += 1
+    css = re.sub(r'\s+', ' ', ''.join(code))
+    css = re.sub(r' ?([{};,>]) ?', r'\1', css)
+    css = css.replace(': ', ':').replace(';}', '}')
+    css = re.sub(r'\0(\d+)\0', lambda m: strings[int(m.group(1))], css)
+    return css.strip()
+
+
+def minifyJs(text):
+    """Strip comments, indentation and blank lines from a script.
+
+    Line breaks are kept, so automatic semicolon insertion behaves as in
+    the source; identifiers are not renamed, so angular's implicit
+    dependency injection keeps working.
+    """
+    out = []
+    i = 0
+    last = ''
+    while i < len(text):
+        c = text[i]
+        if text.startswith('//', i):
+            end = text.find('\n', i)
+            i = len(text) if end < 0 else end
+        elif text.startswith('/*', i):
+            end = text.find('*/', i + 2)
+            i = len(text) if end < 0 else end + 2
+            out.append(' ')
+        elif c in '"\'' or (c == '/' and last in REGEX_PRECEDERS):
+            if c == '/':
+                end = i + 1
+                in_class = False
+                while end < len(text) and (text[end] != '/' or in_class):
+                    if text[end] == '\\':
+                        end += 1
+                    elif text[end] in '[]':
+                        in_class = text[end] == '['
+                    end += 1
+                end += 1
+            else:
+                end = _skipString(text, i)
+            out.append(text[i:end])
+            last = text[end - 1]
+            i = end
+        else:
+            out.append(c)
+            if not c.isspace():
+                last = c
+            i += 1
+    lines = [line.strip() for line in ''.join(out).splitlines()]
+    return '\n'.join(line for line in lines if line)
+
+
+def _hoistImports(css):
+    """Move @import rules to the top, where CSS requires them."""
+    imports = re.findall(r'@import[^;]+;', css)
+    return ''.join(imports) + re.sub(r'@import[^;]+;', '', css)
+
+
+def _gzipSize(data):
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+        f.write(data)
+    return len(buf.getvalue())
+
+
+def writeBundle(kind, sources, minify):
+    """Write the minified bundle of sources; returns (url, report line)."""
+    texts = [_read(path) for path in sources]
+    bundle = '\n'.join(minify(text) for text in texts)
+    if kind == 'css':
+        bundle = _hoistImports(bundle)
+    data = bundle.encode('utf-8')
+    name = 'app-%s.%s' % (hashlib.md5(data).hexdigest()[:10], kind)
+
+    if not os.path.isdir(DIST_DIR):
+        os.makedirs(DIST_DIR)
+    for old in os.listdir(DIST_DIR):
+        if old.endswith('.' + kind) and old != name:
+            os.remove(os.path.join(DIST_DIR, old))
+    with open(os.path.join(DIST_DIR, name), 'wb') as f:
+        f.write(data)
+
+    source_size = sum(len(text.encode('utf-8')) for text in texts)
+    report = '%-18s %d files, %7d -> %7d bytes (%d gzipped)' % (
+        name, len(sources), source_size, len(data), _gzipSize(data))
+    return '%s/%s' % (DIST_URL, name), report
+
+
+def rewriteIndex(urls):
+    """Point the marked blocks of index.html at the bundle urls."""
+    html = _read('templates/index.html')
+    for kind, url in urls.items():
+        start, end, tag = MARKERS[kind]
+        pattern = re.compile(r'(%s\n)(.*?)(\s*%s)' % (
+            re.escape(start), re.escape(end)), re.S)
+        indent = re.search(r'([ \t]*)%s' % re.escape(start), html).group(1)
+        html, count = pattern.subn(
+            lambda m: m.group(1) + indent + tag % url + m.group(3), html)
+        if count != 1:
+            raise ValueError('index.html needs one %s ... %s block'
+                % (start, end))
+    with io.open(INDEX_HTML, 'w', encoding='utf-8', newline='\n') as f:
+        f.write(html)
+
+
+def main():
+    urls = {}
+    reports = []
+    for kind, sources, minify in (('css', CSS_SOURCES, minifyCss),
+            ('js', JS_SOURCES, minifyJs)):
+        urls[kind], report = writeBundle(kind, sources, minify)
+        reports.append(report)
+    rewriteIndex(urls)
+    for report in reports:
+        print(report)
+    print('local asset requests per page load: %d -> %d' % (
+        len(CSS_SOURCES) + len(JS_SOURCES), len(urls)))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+
+"""cache.py
+
+Udacity conference server-side Python App Engine per-instance caches,
+alone or as a tier in front of memcache
+
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from google.appengine.api import memcache
+
+GENERATION_PREFIX = "GEN_"
+
+
+class LRUCache(object):
+    """LRUCache -- thread-safe, size-bounded in-process cache with TTLs"""
+
+    def __init__(self, max_size=1000, ttl=60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return cached value for key, or default if missing or expired."""
+        with self._lock:
+            entry = self._data.pop(key, None)
+            if entry is None:
+                return default
+            value, expires = entry
+            if expires < time.time():
+                return default
+            # re-insert to mark the entry as most recently used
+            self._data[key] = entry
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store value under key for ttl seconds (defaults to cache ttl)."""
+        if ttl is None:
+            ttl = self.ttl
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (value, time.time() + ttl)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        """Remove key from the cache if present."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """Remove every entry from the cache."""
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TieredCache(object):
+    """TieredCache -- per-instance LRUCache tier in front of memcache
+
+    A value read from memcache is served from process memory for ttl
+    seconds. After that it is revalidated against the key's generation,
+    a counter published in memcache that every write bumps: an unchanged
+    generation costs one small memcache read and keeps the local value,
+    a new one refetches it. Missing keys are cached as None too, so a
+    hot key never sends each request to the same memcache server.
+    """
+
+    def __init__(self, max_size=1000, ttl=5, max_stale=300):
+        self.ttl = ttl
+        # holds (value, generation, fresh until) per key
+        self._local = LRUCache(max_size=max_size, ttl=max_stale)
+
+    @staticmethod
+    def _generationKey(key):
+        return GENERATION_PREFIX + key
+
+    def _generation(self, key):
+        gen_key = self._generationKey(key)
+        gen = memcache.get(gen_key)
+        if gen is None:
+            # start from the clock, so a generation evicted from memcache
+            # does not restart at a value some instance already holds
+            memcache.add(gen_key, int(time.time() * 1000))
+            gen = memcache.get(gen_key)
+        return gen
+
+    def get(self, key):
+        """Return the value of key, or None if memcache does not hold it."""
+        now = time.time()
+        entry = self._local.get(key)
+        if entry is not None and entry[2] > now:
+            return entry[0]
+        # read the generation before the value: a value written after it
+        # comes with a newer generation, so it is refetched next time
+        gen = self._generation(key)
+        if entry is not None and gen is not None and entry[1] == gen:
+            value = entry[0]
+        else:
+            value = memcache.get(key)
+        self._local.set(key, (value, gen, now + self.ttl))
+        return value
+
+    def set(self, key, value, time=0):
+        """Store value in memcache and invalidate every local copy."""
+        memcache.set(key, value, time=time)
+        self.invalidate(key)
+
+    def delete(self, key):
+        """Delete key from memcache and invalidate every local copy."""
+        memcache.delete(key)
+        self.invalidate(key)
+
+    def invalidate(self, key):
+        """Drop the local copy of key and bump its generation, so other
+        instances drop theirs within ttl seconds."""
+        self._local.delete(key)
+        memcache.incr(self._generationKey(key),
+            initial_value=int(time.time() * 1000))
@@ -12,20 +12,30 @@ created by wesc on 2014 apr 21
 
 
 from datetime import datetime
+from datetime import time as dt_time
+from datetime import timedelta
+import hashlib
+import heapq
+import httplib
 import json
+import logging
+import operator
 import os
+import random
 import time
-import datetime
 
 import endpoints
 from protorpc import messages
 from protorpc import message_types
+from protorpc import protojson
 from protorpc import remote
 
 from google.appengine.api import urlfetch
 from google.appengine.ext import ndb
 from google.appengine.api import memcache
 from google.appengine.api import taskqueue
+from google.appengine.api import datastore_errors
+from google.appengine.datastore.datastore_query import Cursor
 
 from models import Profile
 from models import ProfileMiniForm
@@ -37,23 +47,75 @@ from models import ConferenceForms
 from models import QueryForm
 from models import QueryForms
 from models import BooleanMessage
-from models import ConflictException
 from models import StringMessage
 from models import Session
 from models import SessionForm
 from models import SessionForms
 from models import Speaker
+from models import ConferenceSpeaker
+from models import AgendaItemForm
+from models import AgendaForm
 from models import SpeakerForm
 from models import SpeakerQueryForm
-
-from utils import getUserId
+from models import StatsBucketForm
+from models import ConferenceStatsForm
+from models import RecommendedConferences
+
+from auth import AuthContext
+from utils import monthsBetween
+from utils import normalizeEmail
+from utils import normalizeSpeakerName
+from utils import parseDate
+from utils import parseIsoWeek
+from utils import parseYearMonth
+from utils import weeksBetween
+from timeline import MINUTES_PER_DAY
+from timeline import addSessionToTimeline
+from timeline import getTimeline
+from timeline import timelineMinute
+from validation import DEFAULTS
+from validation import SESSION_DEFAULTS
+from validation import conferenceData
+from validation import sessionData
+from cache import LRUCache
+from jobs import cacheFeaturedSpeaker
+from jobs import formatFeaturedSpeaker
+from jobs import getAnnouncement
+from jobs import getFeaturedSpeaker
+from jobs import invalidateSessionBuckets
+from jobs import MEMCACHE_SESSION_FORMS_PREFIX
+from jobs import MEMCACHE_SESSION_INDEX_PREFIX
+from stats import countConference
+from stats import countRegistration
+from stats import CONFERENCES
+from stats import REGISTRATIONS
+from stats import SEATS
+from stats import getConferenceStats
 
 from settings import WEB_CLIENT_ID
 
 EMAIL_SCOPE = endpoints.EMAIL_SCOPE
 API_EXPLORER_CLIENT_ID = endpoints.API_EXPLORER_CLIENT_ID
-MEMCACHE_ANNOUNCEMENTS_KEY = "RECENT_ANNOUNCEMENTS"
-MEMCACHE_FEATURED_SPEAKER_KEY = "FEATURED_SPEAKER"
+MEMCACHE_PROFILE_PREFIX = "PROFILE_"
+MEMCACHE_AGENDA_PREFIX = "AGENDA_"
+# placeholder index held in memcache while session buckets are rebuilt
+SESSIONS_REBUILDING = "REBUILDING"
+SESSIONS_REBUILD_LEASE_TTL = 30
+# bounds how long session buckets missing a session could survive
+SESSIONS_CACHE_TTL = 3600
+# bytes of session forms per memcache value; memcache values are limited
+# to 1MB and the margin covers the pickling overhead
+SESSIONS_FORMS_CHUNK_SIZE = 900000
+# agendas are cached under a digest of the registrations and wishlist
+# they were built from; the ttl bounds staleness from other changes
+AGENDA_CACHE_TTL = 3600
+PROFILE_LOCAL_TTL = 5
+
+
+class ConflictException(endpoints.ServiceException):
+    """ConflictException -- exception mapped to HTTP 409 response"""
+    http_status = httplib.CONFLICT
+
 
 CONF_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
@@ -76,27 +138,23 @@ SESS_POST_REQUEST = endpoints.ResourceContainer(
     websafeConferenceKey=messages.StringField(1),
 )
 
+# times are 24h HHMM integers, e.g. 1430
+TIMELINE_GET_REQUEST = endpoints.ResourceContainer(
+    message_types.VoidMessage,
+    websafeConferenceKey=messages.StringField(1),
+    date=messages.StringField(2),
+    time=messages.IntegerField(3, variant=messages.Variant.INT32),
+    endDate=messages.StringField(4),
+    endTime=messages.IntegerField(5, variant=messages.Variant.INT32),
+    count=messages.IntegerField(6, variant=messages.Variant.INT32),
+)
+
 SESS_WISHLIST_GET_REQUEST = endpoints.ResourceContainer(
     message_types.VoidMessage,
     websafeSessionKey=messages.StringField(1),
 )
 
 
-DEFAULTS = {
-            "city": "Default City",
-            "maxAttendees": 0,
-            "seatsAvailable": 0,
-            "topics": [ "Default", "Topic" ],
-            }
-
-SESSION_DEFAULTS = {
-            "highlights": ["Default", "highlights"],
-            "speaker": "Default speaker",
-            "duration": 0,
-            "type_of_session": "default type",
-            "start_time": 0
-            }
-
 OPERATORS = {
             'EQ':   '=',
             'GT':   '>',
@@ -115,9 +173,51 @@ FIELDS =    {
             'START_TIME': 'start_time',
             'DURATION': 'duration',
             'TYPE_OF_SESSION': 'type_of_session',
-            'HIGHLIGHTS': 'highlights'
+            'HIGHLIGHTS': 'highlights',
+            'START_DATE': 'startDate',
+            'END_DATE': 'endDate',
+            'YEAR_MONTH': 'yearMonth',
+            'ISO_WEEK': 'isoWeek'
+            }
+
+# convert filter values from strings to the type stored in the datastore
+FIELD_CONVERTERS = {
+            'month': int,
+            'maxAttendees': int,
+            'seatsAvailable': int,
+            'start_time': int,
+            'duration': int,
+            'startDate': parseDate,
+            'endDate': parseDate,
+            'yearMonth': parseYearMonth,
+            'isoWeek': parseIsoWeek,
             }
 
+# evaluate a formatted filter against a value
+OPERATOR_FUNCTIONS = {
+            '=':  operator.eq,
+            '>':  operator.gt,
+            '>=': operator.ge,
+            '<':  operator.lt,
+            '<=': operator.le,
+            '!=': operator.ne,
+            }
+
+# parsed filter signatures and compiled query templates; they never go
+# stale, so the ttl only has to outlast the instance
+QUERY_TEMPLATE_CACHE_SIZE = 256
+_queryTemplates = LRUCache(max_size=QUERY_TEMPLATE_CACHE_SIZE,
+    ttl=7 * 24 * 3600)
+
+SPEAKER_SESSIONS_PAGE_SIZE = 50
+# keys fetched per datastore round trip by the hybrid session executor
+HYBRID_BATCH_SIZE = 100
+NEXT_SESSIONS_COUNT = 10
+
+# short-lived per-instance Profile cache in front of memcache; entries
+# may lag writes made on other instances by up to PROFILE_LOCAL_TTL secs
+_profileCache = LRUCache(max_size=1000, ttl=PROFILE_LOCAL_TTL)
+
 # - - - - - - - - - - - - - - - - - - - - - - - - - - - - - -
 
 @endpoints.api( name='conference',
@@ -126,6 +226,19 @@ FIELDS =    {
                 scopes=[EMAIL_SCOPE])
 class ConferenceApi(remote.Service):
 
+    def initialize_request_state(self, request_state):
+        """Reset per-request state before the service handles a request."""
+        super(ConferenceApi, self).initialize_request_state(request_state)
+        self._authContext = None
+
+    def _getAuthContext(self):
+        """Return the AuthContext of the current request."""
+        authorization = os.getenv('HTTP_AUTHORIZATION')
+        auth = getattr(self, '_authContext', None)
+        if auth is None or auth.authorization != authorization:
+            auth = self._authContext = AuthContext(authorization)
+        return auth
+
 # - - - Profile objects - - - - - - - - - - - - - - - - - - -
 
     def _copyProfileToForm(self, prof):
@@ -145,49 +258,96 @@ class ConferenceApi(remote.Service):
 
     def _getProfileFromUser(self):
         """Return user Profile from datastore, creating new one if non-existent."""
-        ## TODO 2
-        ## step 1: make sure user is authed
-        ## uncomment the following lines:
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException('Authorization required')
-
-        user_id = getUserId(user)
-        p_key = ndb.Key(Profile, user_id)
-        profile = p_key.get()
-        ## step 2: create a new Profile from logged in user data
-        ## you can use user.nickname() to get displayName
-        ## and user.email() to get mainEmail
-        if not profile:
-            profile = Profile(
-                key = p_key,
-                displayName = user.nickname(), 
-                mainEmail= user.email(),
-                teeShirtSize = str(TeeShirtSize.NOT_SPECIFIED),
-            )
-            profile.put()
-
+        auth = self._getAuthContext()
+        auth.requireUser()
+        if ndb.in_transaction():
+            # read-modify-write callers need the copy read in their txn
+            profile = self._loadProfile(auth)
+            auth.setProfile(profile)
+            return profile
+        return auth.getProfile(lambda: self._loadProfile(auth))
+
+
+    def _loadProfile(self, auth):
+        """Load the Profile of auth's user, creating it if non-existent."""
+        if not ndb.in_transaction():
+            profile = self._getCachedProfile(auth.userId)
+            if profile:
+                return profile
+
+        # get_or_insert creates the Profile transactionally, so concurrent
+        # first requests of a new user cannot overwrite each other
+        user = auth.user
+        profile = Profile.get_or_insert(auth.userId,
+            displayName = user.nickname(),
+            mainEmail = user.email(),
+            normalizedEmail = normalizeEmail(user.email()),
+            teeShirtSize = str(TeeShirtSize.NOT_SPECIFIED),
+        )
+        if not ndb.in_transaction():
+            self._cacheProfile(profile)
         return profile      # return Profile
 
 
+    @staticmethod
+    def _getCachedProfile(user_id):
+        """Return a copy of the cached Profile for user_id, or None."""
+        profile = _profileCache.get(user_id)
+        if profile is None:
+            profile = memcache.get(MEMCACHE_PROFILE_PREFIX + user_id)
+            if profile is None:
+                return None
+            _profileCache.set(user_id, profile)
+        # hand out copies; the cached entity is shared between threads
+        return Profile(key=profile.key, **profile.to_dict())
+
+
+    @staticmethod
+    def _cacheProfile(profile):
+        """Write Profile through to memcache and the instance cache."""
+        user_id = profile.key.id()
+        memcache.set(MEMCACHE_PROFILE_PREFIX + user_id, profile)
+        _profileCache.set(user_id, Profile(key=profile.key, **profile.to_dict()))
+
+
+    def _saveProfile(self, profile):
+        """Put Profile and refresh its cache entries once it is committed.
+
+        Call it inside a transaction with a Profile read in it by
+        _getProfileFromUser; cached copies are only for reading.
+        """
+        profile.put()
+        self._getAuthContext().setProfile(profile)
+
+        ndb.get_context().call_on_commit(lambda: self._cacheProfile(profile))
+
+
     def _doProfile(self, save_request=None):
         """Get user Profile and return to user, possibly updating it first."""
-        # get user Profile
-        prof = self._getProfileFromUser()
-
         # if saveProfile(), process user-modifyable fields
         if save_request:
-            for field in ('displayName', 'teeShirtSize'):
-                if hasattr(save_request, field):
-                    val = getattr(save_request, field)
-                    if val:
-                        setattr(prof, field, str(val))
-            prof.put()
+            prof = self._updateProfile(save_request)
+        else:
+            prof = self._getProfileFromUser()
 
         # return ProfileForm
         return self._copyProfileToForm(prof)
 
 
+    @ndb.transactional()
+    def _updateProfile(self, save_request):
+        """Copy the user-modifyable fields of save_request to the Profile
+        read in this transaction, and save it."""
+        prof = self._getProfileFromUser()
+        for field in ('displayName', 'teeShirtSize'):
+            if hasattr(save_request, field):
+                val = getattr(save_request, field)
+                if val:
+                    setattr(prof, field, str(val))
+        self._saveProfile(prof)
+        return prof
+
+
     @endpoints.method(message_types.VoidMessage, ProfileForm,
             path='profile', 
             http_method='GET', 
@@ -229,39 +389,20 @@ class ConferenceApi(remote.Service):
     def _createConferenceObject(self, request):
         """Create or update Conference object, returning ConferenceForm/request."""
         # preload necessary data items
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException('Authorization required')
-        user_id = getUserId(user)
-
-        if not request.name:
-            raise endpoints.BadRequestException("Conference 'name' field required")
-
-        # copy ConferenceForm/ProtoRPC Message into dict
-        data = {field.name: getattr(request, field.name) for field in request.all_fields()}
-        del data['websafeKey']
-        del data['organizerDisplayName']
-
-        # add default values for those missing (both data model & outbound Message)
+        auth = self._getAuthContext()
+        user = auth.requireUser()
+        user_id = auth.userId
+
+        # copy ConferenceForm/ProtoRPC Message into dict and validate it
+        try:
+            data = conferenceData({field.name: getattr(request, field.name)
+                for field in request.all_fields()})
+        except ValueError as e:
+            raise endpoints.BadRequestException(str(e))
+
+        # copy default values and seatsAvailable to the outbound Message
         for df in DEFAULTS:
-            if data[df] in (None, []):
-                data[df] = DEFAULTS[df]
-                setattr(request, df, DEFAULTS[df])
-
-        # convert dates from strings to Date objects; set month based on start_date
-        if data['startDate']:
-            data['startDate'] = datetime.strptime(data['startDate'][:10], "%Y-%m-%d").date()
-            data['month'] = data['startDate'].month
-        else:
-            data['month'] = 0
-        if data['endDate']:
-            data['endDate'] = datetime.strptime(data['endDate'][:10], "%Y-%m-%d").date()
-
-        # set seatsAvailable to be same as maxAttendees on creation
-        # both for data model & outbound Message
-        if data["maxAttendees"] > 0:
-            data["seatsAvailable"] = data["maxAttendees"]
-            setattr(request, "seatsAvailable", data["maxAttendees"])
+            setattr(request, df, data[df])
 
         # make Profile Key from user ID
         p_key = ndb.Key(Profile, user_id)
@@ -274,7 +415,7 @@ class ConferenceApi(remote.Service):
 
         # create Conference, send email to organizer confirming
         # creation of Conference & return (modified) ConferenceForm
-        Conference(**data).put()
+        self._putConference(Conference(**data))
         taskqueue.add(params={'email': user.email(),
             'conferenceInfo': repr(request)},
             url='/tasks/send_confirmation_email'
@@ -282,6 +423,13 @@ class ConferenceApi(remote.Service):
 
         return request
 
+    @staticmethod
+    @ndb.transactional(xg=True)
+    def _putConference(conf):
+        """Put a new Conference and count it in the conference stats."""
+        conf.put()
+        countConference(conf)
+
     @endpoints.method(ConferenceForm, ConferenceForm, 
         path='conference', 
         http_method='POST', 
@@ -291,38 +439,142 @@ class ConferenceApi(remote.Service):
         return self._createConferenceObject(request)
 
     def _getQuery(self, request):
-        """Return formatted query from the submitted filters."""
-        q = Conference.query()
-        inequality_filter, filters = self._formatFilters(request.filters)
+        """Return formatted query from the submitted filters, plus any
+        filters the query could not express that must be checked in memory.
+        """
+        filters, residual = self._splitInequalities(Conference,
+            self._planDateFilters(self._parseFilters(request.filters)))
+        # compare through the model property so dates are converted
+        # to the datastore representation
+        return self._boundQuery(Conference, filters,
+            lambda field: getattr(Conference, field)), residual
+
+    def _boundQuery(self, model, filters, prop):
+        """Return the query of model for formatted filters.
+
+        The query is compiled once per filter signature, the kind plus
+        the field and operator of each filter, into a template with one
+        ndb Parameter per filter; later queries of the same shape only
+        bind their values. prop maps a field to the Property to compare.
+        """
+        signature = (model._get_kind(),) + tuple(
+            (filtr["field"], filtr["operator"]) for filtr in filters)
+        template = _queryTemplates.get(signature)
+        if template is None:
+            template = self._compileQuery(model, filters, prop)
+            _queryTemplates.set(signature, template)
+        return template.bind(*[filtr["value"] for filtr in filters])
+
+    def _compileQuery(self, model, filters, prop):
+        """Return a query template of model with a Parameter per filter."""
+        q = model.query()
+        inequality_filter = self._inequalityField(filters)
 
         # If exists, sort on inequality filter first
         if not inequality_filter:
-            q = q.order(Conference.name)
+            q = q.order(model.name)
         else:
-            q = q.order(ndb.GenericProperty(inequality_filter))
-            q = q.order(Conference.name)
+            q = q.order(prop(inequality_filter))
+            q = q.order(model.name)
 
-        for filtr in filters:
-            if filtr["field"] in ["month", "maxAttendees"]:
-                filtr["value"] = int(filtr["value"])
-            formatted_query = ndb.query.FilterNode(filtr["field"], filtr["operator"], filtr["value"])
-            q = q.filter(formatted_query)
+        for i, filtr in enumerate(filters):
+            q = q.filter(ndb.query.ParameterNode(prop(filtr["field"]),
+                filtr["operator"], ndb.query.Parameter(i + 1)))
         return q
 
-    def _formatFilters(self, filters):
-        """Parse, check validity and format user supplied filters."""
-        formatted_filters = []
-        inequality_field = None
+    def _planDateFilters(self, filters):
+        """Rewrite a startDate range into a calendar bucket equality filter.
 
-        for f in filters:
-            filtr = {field.name: getattr(f, field.name) for field in f.all_fields()}
+        A range covering exactly one ISO week or month becomes an
+        isoWeek/yearMonth equality, which leaves the datastore inequality
+        free for another field. Other ranges stay startDate inequalities:
+        their buckets would need an IN filter, which the datastore runs as
+        merged queries that cannot be paged with cursors.
+        """
+        date_filters = [f for f in filters if f["field"] == "startDate"
+            and f["operator"] in ("<", "<=", ">", ">=")]
+        if not date_filters:
+            return filters
+
+        first = last = None
+        for f in date_filters:
+            if f["operator"] in (">", ">="):
+                bound = f["value"] + timedelta(days=f["operator"] == ">")
+                first = bound if first is None else max(first, bound)
+            else:
+                bound = f["value"] - timedelta(days=f["operator"] == "<")
+                last = bound if last is None else min(last, bound)
+        if first is None or last is None or first > last:
+            return filters
+
+        months = monthsBetween(first, last)
+        weeks = weeksBetween(first, last)
+        if len(weeks) == 1 and first.weekday() == 0 and last.weekday() == 6:
+            bucket_filter = {"field": "isoWeek", "operator": "=",
+                "value": weeks[0]}
+        elif len(months) == 1 and first.day == 1 and \
+                (last + timedelta(days=1)).day == 1:
+            bucket_filter = {"field": "yearMonth", "operator": "=",
+                "value": months[0]}
+        else:
+            return filters
+        return [f for f in filters if f not in date_filters] + \
+            [bucket_filter]
 
+    def _matchesFilters(self, entity, filters):
+        """Return True if entity satisfies every formatted filter."""
+        for filtr in filters:
+            value = getattr(entity, filtr["field"], None)
+            check = OPERATOR_FUNCTIONS[filtr["operator"]]
+            if isinstance(value, list):
+                # repeated properties match if any of their values does
+                if not any(check(v, filtr["value"]) for v in value):
+                    return False
+            elif value is None:
+                # the datastore sorts null before every other value
+                if filtr["operator"] not in ("!=", "<", "<="):
+                    return False
+            elif not check(value, filtr["value"]):
+                return False
+        return True
+
+    def _parseFilters(self, filters):
+        """Map user supplied filters to model fields, operators and values.
+
+        The fields, operators and value converters of a filter signature
+        are looked up once and cached; only the values are converted on
+        each request.
+        """
+        signature = ("QueryForm",) + tuple((f.field, f.operator)
+            for f in filters)
+        specs = _queryTemplates.get(signature)
+        if specs is None:
             try:
-                filtr["field"] = FIELDS[filtr["field"]]
-                filtr["operator"] = OPERATORS[filtr["operator"]]
+                specs = [(FIELDS[f.field], OPERATORS[f.operator])
+                    for f in filters]
             except KeyError:
                 raise endpoints.BadRequestException("Filter contains invalid field or operator.")
+            specs = [(field, op, FIELD_CONVERTERS.get(field))
+                for field, op in specs]
+            _queryTemplates.set(signature, specs)
 
+        formatted_filters = []
+        for f, (field, op, convert) in zip(filters, specs):
+            value = f.value
+            if convert:
+                try:
+                    value = convert(value)
+                except (TypeError, ValueError):
+                    raise endpoints.BadRequestException(
+                        "Invalid value for %s: %s" % (f.field, f.value))
+            formatted_filters.append(
+                {"field": field, "operator": op, "value": value})
+        return formatted_filters
+
+    def _inequalityField(self, filters):
+        """Return the single field with inequality filters, if any."""
+        inequality_field = None
+        for filtr in filters:
             # Every operation except "=" is an inequality
             if filtr["operator"] != "=":
                 # check if inequality operation has been used in previous filters
@@ -332,9 +584,7 @@ class ConferenceApi(remote.Service):
                     raise endpoints.BadRequestException("Inequality filter is allowed on only one field.")
                 else:
                     inequality_field = filtr["field"]
-
-            formatted_filters.append(filtr)
-        return (inequality_field, formatted_filters)
+        return inequality_field
 
 
     @endpoints.method(QueryForms, ConferenceForms,
@@ -342,12 +592,15 @@ class ConferenceApi(remote.Service):
         http_method='POST',
         name='queryConferences')
     def queryConferences(self, request):
-        """Query for conferences."""
-        conferences = self._getQuery(request)
+        """Query for conferences; results are paged when pageSize is given"""
+        q, residual = self._getQuery(request)
+        conferences, next_page_token = self._runHybridQuery(
+            q, residual, request.pageSize, request.pageToken)
          # return individual ConferenceForm object per Conference
         return ConferenceForms(
             items=[self._copyConferenceToForm(conf, "") \
-            for conf in conferences]
+            for conf in conferences],
+            nextPageToken=next_page_token
         )
 
     @endpoints.method(message_types.VoidMessage, ConferenceForms,
@@ -356,14 +609,8 @@ class ConferenceApi(remote.Service):
         name='getConferencesCreated')
     def getConferencesCreated(self, request):
         """Find all conferences created by the current user"""
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException('Authorization required')
-
-        p_key = ndb.Key(Profile, getUserId(user))
-        conferences = Conference.query(ancestor=p_key)
-
-        prof = p_key.get()
+        prof = self._getProfileFromUser()
+        conferences = Conference.query(ancestor=prof.key)
         displayName = getattr(prof, 'displayName')
 
         return ConferenceForms(
@@ -433,6 +680,7 @@ class ConferenceApi(remote.Service):
             # register user, take away one seat
             prof.conferenceKeysToAttend.append(wsck)
             conf.seatsAvailable -= 1
+            countRegistration(conf)
             retval = True
 
         # unregister
@@ -443,12 +691,13 @@ class ConferenceApi(remote.Service):
                 # unregister user, add back one seat
                 prof.conferenceKeysToAttend.remove(wsck)
                 conf.seatsAvailable += 1
+                countRegistration(conf, -1)
                 retval = True
             else:
                 retval = False
 
         # write things back to the datastore & return
-        prof.put()
+        self._saveProfile(prof)
         conf.put()
         return BooleanMessage(data=retval)
 
@@ -494,45 +743,57 @@ class ConferenceApi(remote.Service):
         """Unregister user for selected conference."""
         return self._conferenceRegistration(request, reg=False)
 
-# - - - Announcements - - - - - - - - - - - - - - - - - - - -
+# - - - Recommendations - - - - - - - - - - - - - - - - - -
+    @endpoints.method(CONF_GET_REQUEST, ConferenceForms,
+            path='conference/{websafeConferenceKey}/recommended',
+            http_method='GET',
+            name='getRecommendedConferences')
+    def getRecommendedConferences(self, request):
+        """Return the conferences most similar to a conference, best first,
+        as precomputed by the nightly recommendation job."""
+        recommended = ndb.Key(RecommendedConferences,
+            request.websafeConferenceKey).get()
+        if not recommended:
+            return ConferenceForms(items=[])
+        conferences = ndb.get_multi(recommended.conferenceKeys)
+        return ConferenceForms(items=[self._copyConferenceToForm(conf, "")
+            for conf in conferences if conf])
+
+# - - - Statistics - - - - - - - - - - - - - - - - - - - - -
     @staticmethod
-    def _cacheAnnouncement():
-        """Create Announcement & assign to memcache; used by
-        memcache cron job & putAnnouncement().
-        """
-        confs = Conference.query(ndb.AND(
-            Conference.seatsAvailable <= 5,
-            Conference.seatsAvailable > 0)
-        ).fetch(projection=[Conference.name])
-
-        if confs:
-            # If there are almost sold out conferences,
-            # format announcement and set it in memcache
-            announcement = '%s %s' % (
-                'Last chance to attend! The following conferences '
-                'are nearly sold out:',
-                ', '.join(conf.name for conf in confs))
-            memcache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
-        else:
-            # If there are no sold out conferences,
-            # delete the memcache announcements entry
-            announcement = ""
-            memcache.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
-
-        return announcement
-
+    def _copyStatsToForm(counts):
+        """Copy summed stats buckets to ConferenceStatsForm"""
+        by = {'city': [], 'month': []}
+        for bucket in sorted(counts):
+            if ':' in bucket:
+                group, name = bucket.split(':', 1)
+                row = counts[bucket]
+                by[group].append(StatsBucketForm(name=name,
+                    conferences=row[CONFERENCES], seats=row[SEATS],
+                    registrations=row[REGISTRATIONS]))
+        total = counts.get('', [0, 0, 0])
+        return ConferenceStatsForm(conferences=total[CONFERENCES],
+            seats=total[SEATS], registrations=total[REGISTRATIONS],
+            byCity=by['city'],
+            byMonth=sorted(by['month'], key=lambda b: int(b.name)))
+
+    @endpoints.method(message_types.VoidMessage, ConferenceStatsForm,
+            path='conferences/stats',
+            http_method='GET',
+            name='getConferenceStats')
+    def getConferenceStats(self, request):
+        """Return counts of conferences, seats and registrations, overall
+        and by city and month; may lag writes by up to a minute."""
+        return self._copyStatsToForm(getConferenceStats())
 
+# - - - Announcements - - - - - - - - - - - - - - - - - - - -
     @endpoints.method(message_types.VoidMessage, StringMessage,
             path='conference/announcement/get',
             http_method='GET', 
             name='getAnnouncement')
     def getAnnouncement(self, request):
         """Return Announcement from memcache."""
-        # return an existing announcement from Memcache or an empty string.
-        announcement = memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY)
-        if not announcement:
-            announcement = ""
-        return StringMessage(data=announcement)
+        return StringMessage(data=getAnnouncement())
 
 
 # - - - Session objects - - - - - - - - - - - - - - - - -
@@ -566,12 +827,10 @@ class ConferenceApi(remote.Service):
     def getConferenceSessions(self, request):
         """Given a conference websafekey, return all sessions for it"""
         conf_key = ndb.Key(urlsafe=request.websafeConferenceKey)
-        conf = conf_key.get()
-        if not conf:
-            raise endpoints.NotFoundException(
-                'No conference found with key: %s' % request.websafeConferenceKey)
-        sessions = Session.query(ancestor=conf_key)
-        return SessionForms(items=[self._copySessionToForm(sess) for sess in sessions])
+        index, forms = self._getSessionBuckets(conf_key, check_conference=True)
+        return SessionForms(items=[
+            protojson.decode_message(SessionForm, forms[wssk])
+            for wssk in index['order']])
     
     @endpoints.method(SESS_GET_REQUEST, SessionForms,
         path='getConferenceSessionsByType/{websafeConferenceKey}',
@@ -580,9 +839,104 @@ class ConferenceApi(remote.Service):
     def getConferenceSessionsByType(self, request):
         """Given a conference, return all sessions of a specified type"""
         c_key = ndb.Key(urlsafe=request.websafeConferenceKey)
-        sessions = Session.query(ancestor=c_key)
-        sessions = sessions.filter(Session.type_of_session == request.session_type)
-        return SessionForms(items=[self._copySessionToForm(sess) for sess in sessions])
+        index, forms = self._getSessionBuckets(c_key)
+        return SessionForms(items=[
+            protojson.decode_message(SessionForm, forms[wssk])
+            for wssk in index['byType'].get(request.session_type, [])])
+
+    def _getSessionBuckets(self, conf_key, check_conference=False):
+        """Return a conference's cached session index and serialized forms.
+
+        The index holds the session keys in agenda order ('order') and
+        grouped by type_of_session ('byType'); forms maps each key to its
+        protojson-encoded SessionForm. The forms are cached in chunks that
+        fit in a memcache value; the index and the first chunk come from
+        one memcache get_multi and are rebuilt from a single ancestor query
+        on a miss.
+
+        A rebuild first leaves a placeholder index, replacing a missing or
+        stale one, and stores its own with compare-and-set, so a rebuild
+        overtaken by invalidateSessionBuckets is not cached. Index and
+        chunks carry the id of their rebuild; chunks from another rebuild
+        are treated as a miss.
+        """
+        wsck = conf_key.urlsafe()
+        index_key = MEMCACHE_SESSION_INDEX_PREFIX + wsck
+        forms_key = MEMCACHE_SESSION_FORMS_PREFIX + wsck
+        client = memcache.Client()
+        cached = client.get_multi([index_key, forms_key], for_cas=True)
+        index = cached.get(index_key)
+        if isinstance(index, dict):
+            chunk_keys = self._sessionFormsKeys(forms_key, index['chunks'])
+            if len(chunk_keys) > 1:
+                cached.update(client.get_multi(chunk_keys[1:]))
+            chunks = [cached.get(key) for key in chunk_keys]
+            if all(chunk and chunk['rebuild'] == index['rebuild']
+                    for chunk in chunks):
+                forms = {}
+                for chunk in chunks:
+                    forms.update(chunk['forms'])
+                return index, forms
+
+        if check_conference and not conf_key.get():
+            raise endpoints.NotFoundException(
+                'No conference found with key: %s' % wsck)
+        if index is None:
+            client.add(index_key, SESSIONS_REBUILDING,
+                time=SESSIONS_REBUILD_LEASE_TTL)
+            index = client.gets(index_key)
+        elif index != SESSIONS_REBUILDING:
+            # the index outlived its forms, or they are from another rebuild
+            client.cas(index_key, SESSIONS_REBUILDING,
+                time=SESSIONS_REBUILD_LEASE_TTL)
+            index = client.gets(index_key)
+        leased = index == SESSIONS_REBUILDING
+
+        sessions = sorted(Session.query(ancestor=conf_key),
+            key=lambda sess: (sess.date, sess.start_time, sess.name))
+        rebuild = random.getrandbits(64)
+        index = {'order': [], 'byType': {}, 'rebuild': rebuild}
+        forms = {}
+        for sess in sessions:
+            wssk = sess.key.urlsafe()
+            index['order'].append(wssk)
+            index['byType'].setdefault(sess.type_of_session, []).append(wssk)
+            forms[wssk] = protojson.encode_message(self._copySessionToForm(sess))
+        if leased:
+            chunks = self._chunkSessionForms(forms)
+            index['chunks'] = len(chunks)
+            try:
+                client.set_multi(dict(zip(
+                    self._sessionFormsKeys(forms_key, len(chunks)),
+                    [{'rebuild': rebuild, 'forms': chunk} for chunk in chunks])),
+                    time=SESSIONS_CACHE_TTL)
+                client.cas(index_key, index, time=SESSIONS_CACHE_TTL)
+            except ValueError:
+                # a form or the index alone exceeds the memcache value
+                # size; leave the lease to expire rather than cache them
+                logging.warning('Session buckets of %s too large to cache',
+                    wsck)
+        return index, forms
+
+    @staticmethod
+    def _sessionFormsKeys(forms_key, count):
+        """Return the memcache keys of count chunks of session forms."""
+        return [forms_key] + ['%s_%d' % (forms_key, i)
+            for i in range(1, count)]
+
+    @staticmethod
+    def _chunkSessionForms(forms):
+        """Split forms into dicts of at most SESSIONS_FORMS_CHUNK_SIZE
+        bytes of keys and encoded forms each."""
+        chunks = [{}]
+        size = 0
+        for wssk, form in sorted(forms.iteritems()):
+            if size and size + len(wssk) + len(form) > SESSIONS_FORMS_CHUNK_SIZE:
+                chunks.append({})
+                size = 0
+            chunks[-1][wssk] = form
+            size += len(wssk) + len(form)
+        return chunks
 
     @endpoints.method(SpeakerQueryForm, SessionForms,
         path='getSessionsBySpeaker',
@@ -591,34 +945,54 @@ class ConferenceApi(remote.Service):
     def getSessionsBySpeaker(self, request):
         """Given a speaker, return all sessions given by this particular speaker
         across all conferences"""
-        speaker = Speaker.query()
-        speaker = speaker.filter(Speaker.name == request.name).get()
+        speaker = None
+        if request.name:
+            speaker = Speaker.get_by_id(normalizeSpeakerName(request.name))
         if not speaker:
             raise endpoints.NotFoundException(
                 'No speaker found with name %s' % request.name)
-        sessions = speaker.hosting_sessions
-        all_sessions = Session.query()
-        speaker_sessions = []
-        for session in sessions:
-            speaker_sessions.append(all_sessions.filter(Session.name == session).get())
 
-        return SessionForms(items=[self._copySessionToForm(sess) for sess in speaker_sessions])
+        # page through the speaker's session keys; the token is the offset
+        # of the next page in speaker.sessionKeys
+        try:
+            offset = int(request.pageToken or 0)
+        except ValueError:
+            raise endpoints.BadRequestException(
+                'Invalid pageToken: %s' % request.pageToken)
+        page_size = request.pageSize or SPEAKER_SESSIONS_PAGE_SIZE
+        keys = speaker.sessionKeys[offset:offset + page_size]
+        next_offset = offset + page_size
+        if next_offset < len(speaker.sessionKeys):
+            next_page_token = str(next_offset)
+        else:
+            next_page_token = None
+
+        speaker_sessions = [s for s in ndb.get_multi(keys) if s]
+        return SessionForms(
+            items=[self._copySessionToForm(sess) for sess in speaker_sessions],
+            nextPageToken=next_page_token)
     
-    def _createSpeakerObject(self, request):
-        """If a speaker has been found not to exist, this creates one
-        and immediately adds the first session that references him or her"""
-        speaker = Speaker(
-            name = request.speaker,
-            hosting_sessions = [request.name]) # name of session
+    @ndb.transactional()
+    def _addSessionToSpeaker(self, request, s_key):
+        """Add a session to its speaker, creating the speaker if it does not
+        exist yet. Speakers are keyed by normalized name, so this is a key
+        lookup and concurrent requests cannot create duplicates.
+        Returns (speaker, created)."""
+        sp_key = ndb.Key(Speaker, normalizeSpeakerName(request.speaker))
+        speaker = sp_key.get()
+        created = speaker is None
+        if created:
+            speaker = Speaker(key=sp_key, name=request.speaker)
+        speaker.hosting_sessions.append(request.name) # name of session
+        speaker.sessionKeys.append(s_key)
         speaker.put()
-        return None
+        return speaker, created
         
     def _createSessionObject(self, request):
         """Create Session object, returning SessionForm/request."""
-        user = endpoints.get_current_user()
-        if not user:
-            raise endpoints.UnauthorizedException("Authorization required")
-        user_id = getUserId(user)
+        auth = self._getAuthContext()
+        user = auth.requireUser()
+        user_id = auth.userId
         conf_key = ndb.Key(urlsafe=request.websafeConferenceKey)
         conf = conf_key.get()
         if not conf:
@@ -629,78 +1003,68 @@ class ConferenceApi(remote.Service):
             raise endpoints.ForbiddenException("Must be conference \
                 organizer to add sessions to conference.")
 
-        if not request.name:
-            raise endpoints.BadRequestException("Session 'name' field required.")
-
-        data = {field.name: getattr(request, field.name)
-            for field in request.all_fields()}
-        del data['websafeKey']
-        del data['websafeConferenceKey']
-        # fill in default values for missing fields
+        try:
+            data = sessionData({field.name: getattr(request, field.name)
+                for field in request.all_fields()}, conf)
+        except ValueError as e:
+            raise endpoints.BadRequestException(str(e))
+        # fill in default values for missing fields of the outbound Message
         for df in SESSION_DEFAULTS:
-            if data[df] in (None, []):
-                data[df] = SESSION_DEFAULTS[df]
-                setattr(request, df, SESSION_DEFAULTS[df])
-        # if a session date is provided, create a date object from the string
-        if data["date"]:
-            data["date"] = datetime.strptime(data["date"][:10], "%Y-%m-%d").date()
-        else:
-            data["date"] = conf.startDate
+            setattr(request, df, data[df])
         # allocate new Session ID with Conference key as parent
         s_id = Session.allocate_ids(size=1, parent=conf_key)[0]
         # create a Session key from ID
         s_key = ndb.Key(Session, s_id, parent=conf_key)
         data['key'] = s_key
         # create Session and return modified SessionForm
-        Session(**data).put()
+        session = Session(**data)
+        featured_speaker = self._putSession(session, request)
+        addSessionToTimeline(session)
+        invalidateSessionBuckets(conf_key)
         formatted_session = self._copySessionToForm(request)
         taskqueue.add(params={'email': user.email(),
             'sessionInfo': repr(formatted_session)},
             url='/tasks/send_session_email')
 
-        """Check for submitted speaker in form. If speaker doesn't exist
-        then create new speaker object. If one already exists, see whether
-        he's hosting other sessions at this conference.  If so, create a
-        memcache feature for him.  Finally, add this session to his list."""
-        if request.speaker:
-            speaker = Speaker.query()
-            speaker = speaker.filter(Speaker.name == request.speaker).get()
-            if not speaker:
-                self._createSpeakerObject(request)
-            else:
-                sessions = Session.query(ancestor=conf_key)
-                sessions = sessions.filter(Session.speaker == request.speaker).fetch()
-                if len(sessions) > 1:
-                    featured_speaker = '%s is hosting sessions: %s' %(
-                        speaker.name, ', '.join(s.name for s in sessions))
-                else:
-                    featured_speaker = ''
-                taskqueue.add(params={'speaker': featured_speaker},
-                    target='main',
-                    url='/tasks/set_featured_speaker')
-                speaker.hosting_sessions.append(request.name)
-                speaker.put()   
+        if featured_speaker:
+            cacheFeaturedSpeaker(conf_key, featured_speaker)
         return self._copySessionToForm(request)
-    '''
-    def _cacheFeaturedSpeaker(self, speaker):
-        """Sets featured speaker in memcache"""
-        if speaker:
-            memcache.set(MEMCACHE_FEATURED_SPEAKER_KEY, speaker)
-        else:
-            memcache.delete(MEMCACHE_FEATURED_SPEAKER_KEY)
-        return speaker
-    '''
 
-    @endpoints.method(message_types.VoidMessage, StringMessage,
-        path='featuredspeaker',
+    @ndb.transactional(xg=True)
+    def _putSession(self, session, request):
+        """Put a new Session together with its speaker bookkeeping.
+
+        The session is added to its Speaker and its ConferenceSpeaker count,
+        so no query is needed to find featured speakers. Returns the new
+        featured speaker announcement, or None if it did not change."""
+        session.put()
+        if not request.speaker:
+            return None
+        self._addSessionToSpeaker(request, session.key)
+
+        conf_key = session.key.parent()
+        cs_key = ndb.Key(ConferenceSpeaker,
+            normalizeSpeakerName(request.speaker), parent=conf_key)
+        conf_speaker = cs_key.get() or ConferenceSpeaker(
+            key=cs_key, name=request.speaker)
+        conf_speaker.sessionNames.append(request.name)
+        conf_speaker.sessionCount += 1
+        featured = conf_speaker.sessionCount > 1
+        if featured:
+            conf_speaker.lastFeatured = datetime.now()
+        conf_speaker.put()
+        if featured:
+            return formatFeaturedSpeaker(conf_speaker)
+        return None
+
+    @endpoints.method(CONF_GET_REQUEST, StringMessage,
+        path='conference/{websafeConferenceKey}/featuredspeaker',
         http_method='GET',
         name='getFeaturedSpeaker')
     def getFeaturedSpeaker(self, request):
-        """Returns a featured speaker from memcache"""
-        speaker = memcache.get(MEMCACHE_FEATURED_SPEAKER_KEY)
-        if not speaker:
-            speaker = ''
-        return StringMessage(data=speaker)
+        """Returns a conference's featured speaker, from memcache if possible"""
+        conf_key = ndb.Key(urlsafe=request.websafeConferenceKey)
+        return StringMessage(data=getFeaturedSpeaker(conf_key))
 
     @endpoints.method(SESS_POST_REQUEST, SessionForm,
         path='createSession',
@@ -710,36 +1074,154 @@ class ConferenceApi(remote.Service):
         """Create a new session."""
         return self._createSessionObject(request)
 
-    def _getSessionQuery(self, request):
-        """Return formatted query from the submitted filters."""
-        q = Session.query()
-        inequality_filter, filters = self._formatFilters(request.filters)
-
-        # If exists, sort on inequality filter first
-        if not inequality_filter:
-            q = q.order(Session.name)
+    def _timelineMinute(self, date_string, hhmm):
+        """Parse a date string and HHMM time into an absolute timeline minute."""
+        if not date_string:
+            raise endpoints.BadRequestException("'date' field required.")
+        try:
+            day = parseDate(date_string)
+        except ValueError:
+            raise endpoints.BadRequestException(
+                'Invalid date: %s' % date_string)
+        hhmm = hhmm or 0
+        if not (0 <= hhmm < 2400 and hhmm % 100 < 60):
+            raise endpoints.BadRequestException('Invalid time: %s' % hhmm)
+        return timelineMinute(day, hhmm)
+
+    def _copyTimelineSessions(self, websafe_keys):
+        """Fetch timeline session keys in one batch and return SessionForms."""
+        sessions = ndb.get_multi([ndb.Key(urlsafe=k) for k in websafe_keys])
+        return SessionForms(items=[self._copySessionToForm(sess)
+            for sess in sessions if sess])
+
+    @endpoints.method(TIMELINE_GET_REQUEST, SessionForms,
+        path='conference/{websafeConferenceKey}/sessions/running',
+        http_method='GET',
+        name='getSessionsRunningAt')
+    def getSessionsRunningAt(self, request):
+        """Return sessions of a conference running at date and time"""
+        timeline = getTimeline(ndb.Key(urlsafe=request.websafeConferenceKey))
+        minute = self._timelineMinute(request.date, request.time)
+        return self._copyTimelineSessions(timeline.runningAt(minute))
+
+    @endpoints.method(TIMELINE_GET_REQUEST, SessionForms,
+        path='conference/{websafeConferenceKey}/sessions/window',
+        http_method='GET',
+        name='getSessionsInWindow')
+    def getSessionsInWindow(self, request):
+        """Return sessions of a conference overlapping [date time, endDate
+        endTime); endDate defaults to date, and without endTime the window
+        runs to the end of endDate"""
+        timeline = getTimeline(ndb.Key(urlsafe=request.websafeConferenceKey))
+        first = self._timelineMinute(request.date, request.time)
+        end_date = request.endDate or request.date
+        if request.endTime is None:
+            last = self._timelineMinute(end_date, 0) + MINUTES_PER_DAY
         else:
-            q = q.order(ndb.GenericProperty(inequality_filter))
-            q = q.order(Session.name)
+            last = self._timelineMinute(end_date, request.endTime)
+        return self._copyTimelineSessions(timeline.inWindow(first, last))
+
+    @endpoints.method(TIMELINE_GET_REQUEST, SessionForms,
+        path='conference/{websafeConferenceKey}/sessions/next',
+        http_method='GET',
+        name='getNextSessions')
+    def getNextSessions(self, request):
+        """Return the next count sessions of a conference starting at or
+        after date and time"""
+        timeline = getTimeline(ndb.Key(urlsafe=request.websafeConferenceKey))
+        minute = self._timelineMinute(request.date, request.time)
+        return self._copyTimelineSessions(
+            timeline.upcoming(minute, request.count or NEXT_SESSIONS_COUNT))
 
+    def _getSessionQuery(self, request):
+        """Return formatted query from the submitted filters, plus the
+        filters that must be evaluated in memory.
+
+        The datastore allows inequalities on one field only, so equality
+        filters and the inequalities on the most selective field are pushed
+        down; inequalities on any other field are returned as residual."""
+        filters, residual = self._splitInequalities(Session,
+            self._parseFilters(request.filters))
+        return self._boundQuery(Session, filters, ndb.GenericProperty), \
+            residual
+
+    def _splitInequalities(self, model, filters):
+        """Split filters into (pushed down, residual) for one inequality field.
+
+        '!=' is never pushed down: the datastore runs it as two merged
+        queries, which rules out cursors. Neither are inequalities on
+        repeated properties of model, whose cursors do not resume. Among
+        the other inequality fields, a bounded range beats a one-sided
+        one; ties keep the order the filters were given in.
+        """
+        ranks = {}
         for filtr in filters:
-            if filtr["field"] in ["start_time", "duration"]:
-                filtr["value"] = int(filtr["value"])
-            formatted_query = ndb.query.FilterNode(filtr["field"], filtr["operator"], filtr["value"])
-            q = q.filter(formatted_query)
-        return q
+            if filtr["operator"] in ("=", "!="):
+                continue
+            prop = model._properties.get(filtr["field"])
+            if prop is not None and prop._repeated:
+                continue
+            bounds = ranks.setdefault(filtr["field"], set())
+            bounds.add("lower" if filtr["operator"] in (">", ">=") else "upper")
+        pushed_field = None
+        if ranks:
+            pushed_field = min(ranks, key=lambda field: (-len(ranks[field]),
+                [f["field"] for f in filters].index(field)))
+
+        pushed, residual = [], []
+        for filtr in filters:
+            if filtr["operator"] == "=" or (filtr["field"] == pushed_field
+                    and filtr["operator"] != "!="):
+                pushed.append(filtr)
+            else:
+                residual.append(filtr)
+        return pushed, residual
+
+    def _runHybridQuery(self, q, residual, page_size=None, page_token=None):
+        """Stream a keys-only query in batches, filtering entities in memory.
+
+        Returns (entities, next page token). Iteration stops as soon as
+        page_size matches are found; the token is the cursor just past the
+        last key consumed, so the next page resumes mid-batch correctly.
+        """
+        try:
+            start_cursor = Cursor(urlsafe=page_token) if page_token else None
+        except (datastore_errors.BadValueError, TypeError):
+            raise endpoints.BadRequestException(
+                'Invalid pageToken: %s' % page_token)
+        it = q.iter(keys_only=True, start_cursor=start_cursor,
+            produce_cursors=True, batch_size=HYBRID_BATCH_SIZE)
+        results = []
+        while True:
+            batch = []
+            for key in it:
+                batch.append((key, it.cursor_after()))
+                if len(batch) == HYBRID_BATCH_SIZE:
+                    break
+            if not batch:
+                return results, None
+            entities = ndb.get_multi([key for key, cursor in batch])
+            for (key, cursor), entity in zip(batch, entities):
+                if entity and self._matchesFilters(entity, residual):
+                    results.append(entity)
+                    if len(results) == page_size:
+                        return results, cursor.urlsafe()
 
     @endpoints.method(QueryForms, SessionForms,
         path='querySessions',
         http_method='POST',
         name='querySessions')
     def querySessions(self, request):
-        """Query for sessions"""
-        sessions = self._getSessionQuery(request)
+        """Query for sessions; any combination of inequality filters is
+        allowed, results are paged when pageSize is given"""
+        q, residual = self._getSessionQuery(request)
+        sessions, next_page_token = self._runHybridQuery(
+            q, residual, request.pageSize, request.pageToken)
         return SessionForms(items=[self._copySessionToForm(session)\
-            for session in sessions])
+            for session in sessions], nextPageToken=next_page_token)
 
 # - - - Session wishlist - - - - - - - - - - - - - - - - -
+    @ndb.transactional(xg=True)
     def _sessionWishlist(self, request, add_to_list=True):
         '''Add/remove session to/from user's wishlist'''
         prof = self._getProfileFromUser()
@@ -762,16 +1244,16 @@ class ConferenceApi(remote.Service):
                 return_value = True
             else:
                 return_value = False
-        prof.put()
+        self._saveProfile(prof)
         return BooleanMessage(data=return_value)
 
     @endpoints.method(SESS_WISHLIST_GET_REQUEST, BooleanMessage,
         path='session/{websafeSessionKey}',
         http_method='POST',
         name='addSessionToWishlist')
-    def addSessionToWishlist(self, request, add_to_list=True):
+    def addSessionToWishlist(self, request):
         '''Add session to user's list of sessions they want to attend.'''
-        return self._sessionWishlist
+        return self._sessionWishlist(request)
 
     @endpoints.method(message_types.VoidMessage, SessionForms,
         path='sessions/wishlist',
@@ -794,5 +1276,95 @@ class ConferenceApi(remote.Service):
         return self._sessionWishlist(request, add_to_list=False)
 
 
+# - - - Personal agenda - - - - - - - - - - - - - - - - -
+    def _buildAgenda(self, prof):
+        """Build the AgendaForm of a Profile's conferences and wishlist."""
+        # fetch registered conferences and wishlisted sessions concurrently
+        conf_future = ndb.get_multi_async(
+            [ndb.Key(urlsafe=k) for k in prof.conferenceKeysToAttend])
+        sess_future = ndb.get_multi_async(
+            [ndb.Key(urlsafe=k) for k in prof.session_wishlist])
+
+        entries = []    # (start, end, AgendaItemForm)
+        for conf in [f.get_result() for f in conf_future]:
+            if not conf:
+                continue
+            start = datetime.combine(conf.startDate, dt_time()) \
+                if conf.startDate else None
+            end = datetime.combine(conf.endDate or conf.startDate,
+                dt_time()) + timedelta(days=1) if start else None
+            entries.append((start, end, AgendaItemForm(kind='CONFERENCE',
+                name=conf.name, websafeKey=conf.key.urlsafe())))
+
+        sessions = []
+        for sess in [f.get_result() for f in sess_future]:
+            if not sess:
+                continue
+            start = end = None
+            if sess.date:
+                hhmm = sess.start_time or 0
+                start = datetime.combine(sess.date, dt_time(hhmm // 100,
+                    hhmm % 100))
+                end = start + timedelta(minutes=sess.duration or 0)
+            item = AgendaItemForm(kind='SESSION', name=sess.name,
+                websafeKey=sess.key.urlsafe())
+            entries.append((start, end, item))
+            if start:
+                sessions.append((start, end, item))
+        self._flagConflicts(sessions)
+
+        for start, end, item in entries:
+            if start:
+                item.start = start.strftime('%Y-%m-%dT%H:%M')
+                item.end = end.strftime('%Y-%m-%dT%H:%M')
+        # undated items go last
+        entries.sort(key=lambda e: (e[0] is None, e[0], e[2].kind, e[2].name))
+        return AgendaForm(items=[item for start, end, item in entries])
+
+    def _flagConflicts(self, sessions):
+        """Sweep sessions by start time, recording overlapping pairs.
+
+        A heap of the active sessions' end times is kept; every session
+        still active when another starts overlaps it. Costs O(n log n + c)
+        for c conflicting pairs.
+        """
+        active = []     # (end, index)
+        sessions.sort(key=lambda s: s[0])
+        for i, (start, end, item) in enumerate(sessions):
+            while active and active[0][0] <= start:
+                heapq.heappop(active)
+            for other_end, j in active:
+                other = sessions[j][2]
+                other.conflictsWith.append(item.websafeKey)
+                item.conflictsWith.append(other.websafeKey)
+            heapq.heappush(active, (end, i))
+
+    @staticmethod
+    def _agendaVersion(prof):
+        """Return a digest of the Profile fields the agenda is built from."""
+        return hashlib.md5(json.dumps([prof.conferenceKeysToAttend,
+            prof.session_wishlist])).hexdigest()
+
+    @endpoints.method(message_types.VoidMessage, AgendaForm,
+        path='agenda',
+        http_method='GET',
+        name='getMyAgenda')
+    def getMyAgenda(self, request):
+        """Return the user's registered conferences and wishlisted sessions
+        in chronological order, flagging sessions that overlap"""
+        # the cached Profile may lag registrations made on other instances
+        prof = self._getProfileFromUser()
+        prof = prof.key.get() or prof
+        cache_key = MEMCACHE_AGENDA_PREFIX + prof.key.id() + '_' + \
+            self._agendaVersion(prof)
+        agenda = memcache.get(cache_key)
+        if agenda is not None:
+            return protojson.decode_message(AgendaForm, agenda)
+        agenda = self._buildAgenda(prof)
+        memcache.set(cache_key, protojson.encode_message(agenda),
+            time=AGENDA_CACHE_TTL)
+        return agenda
+
+
 # registers API
 api = endpoints.api_server([ConferenceApi])
\ No newline at end of file
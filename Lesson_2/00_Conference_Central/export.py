@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+
+"""export.py
+
+Udacity conference server-side Python App Engine bulk NDJSON export;
+each task writes chunks until its time budget is spent, then chains the
+next task with the query cursor
+
+"""
+
+import datetime
+import json
+import time
+
+from google.appengine.api import taskqueue
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+from models import Conference
+from models import ExportJob
+from models import Profile
+from models import Session
+
+from storage import getBlobStore
+
+EXPORT_KINDS = {
+    'Conference': Conference,
+    'Session': Session,
+    'Profile': Profile,
+}
+EXPORT_CHUNK_SIZE = 500
+# leave headroom below the 10 minute task deadline
+EXPORT_TASK_BUDGET_SECS = 60
+
+
+def _jsonValue(value):
+    """Convert an entity property value into a JSON-compatible value."""
+    if isinstance(value, list):
+        return [_jsonValue(v) for v in value]
+    if isinstance(value, ndb.Key):
+        return value.urlsafe()
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+def entityToJson(entity):
+    """Serialize an entity as one NDJSON line (without the newline)."""
+    record = dict((name, _jsonValue(value))
+        for name, value in entity.to_dict().items())
+    record['websafeKey'] = entity.key.urlsafe()
+    return json.dumps(record, sort_keys=True)
+
+
+def startExport(kind):
+    """Create an ExportJob for kind and enqueue its first task."""
+    if kind not in EXPORT_KINDS:
+        raise ValueError('Cannot export kind: %s' % kind)
+    job = ExportJob(kind=kind)
+
+    @ndb.transactional()
+    def create():
+        job.put()
+        taskqueue.add(params={'job': job.key.id()}, url='/tasks/export',
+            transactional=True)
+    create()
+    return job
+
+
+def _chunkName(job, number):
+    return 'exports/%s/%s-%05d.ndjson' % (job.key.id(), job.kind, number)
+
+
+def _manifestName(job):
+    return 'exports/%s/manifest.json' % job.key.id()
+
+
+def runExport(job_id, store=None):
+    """Write export chunks for a job until the task budget is spent.
+
+    A chunk is named after its position, so a retried task rewrites the
+    same chunk from the same cursor; job progress and the continuation
+    task are committed together.
+    """
+    store = store or getBlobStore()
+    job = ExportJob.get_by_id(job_id)
+    if not job or job.status != 'RUNNING':
+        return job
+    query = EXPORT_KINDS[job.kind].query()
+    deadline = time.time() + EXPORT_TASK_BUDGET_SECS
+
+    # always write at least one chunk so every task makes progress
+    more = True
+    while more:
+        cursor = Cursor(urlsafe=job.cursor) if job.cursor else None
+        entities, next_cursor, more = query.fetch_page(
+            EXPORT_CHUNK_SIZE, start_cursor=cursor)
+        more = bool(more and next_cursor)
+        if entities:
+            name = _chunkName(job, len(job.chunks or []))
+            store.write(name, ''.join(entityToJson(e) + '\n'
+                for e in entities))
+            job.chunks = (job.chunks or []) + [
+                {'name': name, 'count': len(entities)}]
+            job.entityCount += len(entities)
+        job.cursor = next_cursor.urlsafe() if more else None
+        if time.time() >= deadline:
+            break
+
+    if not more:
+        manifest = {'kind': job.kind, 'entityCount': job.entityCount,
+            'chunks': job.chunks or []}
+        job.manifest = _manifestName(job)
+        store.write(job.manifest, json.dumps(manifest, indent=2))
+        job.status = 'DONE'
+
+    @ndb.transactional()
+    def save():
+        job.put()
+        if more:
+            taskqueue.add(params={'job': job_id}, url='/tasks/export',
+                transactional=True)
+    save()
+    return job
+
+
+def exportStatus(job):
+    """Return a JSON-compatible status dict for an ExportJob."""
+    return {
+        'jobId': job.key.id(),
+        'kind': job.kind,
+        'status': job.status,
+        'entityCount': job.entityCount,
+        'chunks': len(job.chunks or []),
+        'manifest': job.manifest,
+        'created': job.created.isoformat(),
+        'updated': job.updated.isoformat(),
+    }
@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+
+"""importer.py
+
+Udacity conference server-side Python App Engine bulk NDJSON import of
+conferences and sessions; each task imports batches until its time
+budget is spent, checkpointing its position in the job
+
+"""
+
+import json
+import time
+
+from google.appengine.api import datastore_errors
+from google.appengine.api import memcache
+from google.appengine.api import taskqueue
+from google.appengine.ext import ndb
+
+from jobs import invalidateFeaturedSpeaker
+from jobs import invalidateSessionBuckets
+from models import Conference
+from models import ImportJob
+from models import Profile
+from models import Session
+from models import Speaker
+from stats import countImportedConferences
+from storage import getBlobStore
+from timeline import MEMCACHE_TIMELINE_PREFIX
+from utils import normalizeSpeakerName
+from validation import conferenceData
+from validation import sessionData
+
+IMPORT_KINDS = {
+    'Conference': Conference,
+    'Session': Session,
+}
+IMPORT_BATCH_SIZE = 500
+# leave headroom below the 10 minute task deadline
+IMPORT_TASK_BUDGET_SECS = 60
+# invalid records reported on the job; the rest are only counted
+IMPORT_MAX_ERRORS = 100
+RECORD_ERRORS = (ValueError, TypeError, datastore_errors.Error)
+
+
+def startImport(manifest_name, store=None):
+    """Create an ImportJob for the chunks of a manifest and enqueue it.
+
+    The manifest is a JSON object {"kind": ..., "chunks": [{"name": ...}]}
+    naming NDJSON blobs in the blob store, as written by the bulk export.
+    """
+    store = store or getBlobStore()
+    manifest = json.loads(store.read(manifest_name))
+    if manifest.get('kind') not in IMPORT_KINDS:
+        raise ValueError('Cannot import kind: %s' % manifest.get('kind'))
+    job = ImportJob(kind=manifest['kind'],
+        chunks=[chunk['name'] for chunk in manifest.get('chunks', [])])
+
+    @ndb.transactional()
+    def create():
+        job.put()
+        taskqueue.add(params={'job': job.key.id()}, url='/tasks/import',
+            transactional=True)
+    create()
+    return job
+
+
+def _parseKey(websafe_key, kind):
+    """Return the ndb.Key of a websafe key string, which must be of kind."""
+    try:
+        key = ndb.Key(urlsafe=websafe_key)
+    except Exception:
+        raise ValueError('Invalid key: %r' % websafe_key)
+    if key.kind() != kind:
+        raise ValueError('Not a %s key: %r' % (kind, websafe_key))
+    return key
+
+
+def _conferenceEntities(records):
+    """Return (parent key, new Conference without a key), or a ValueError,
+    per record."""
+    entities = []
+    for record in records:
+        try:
+            if not record.get('organizerUserId'):
+                raise ValueError("Conference 'organizerUserId' field required")
+            data = conferenceData(record)
+            if record.get('seatsAvailable') is not None:
+                # keep the registrations of exported conferences
+                data['seatsAvailable'] = int(record['seatsAvailable'])
+                if not 0 <= data['seatsAvailable'] <= data['maxAttendees']:
+                    raise ValueError('Invalid seatsAvailable: %s'
+                        % record['seatsAvailable'])
+            entities.append((ndb.Key(Profile, record['organizerUserId']),
+                Conference(**data)))
+        except RECORD_ERRORS as e:
+            entities.append(ValueError(e))
+    return entities
+
+
+def _sessionConferenceKey(record):
+    if record.get('websafeConferenceKey'):
+        return _parseKey(record['websafeConferenceKey'], 'Conference')
+    if record.get('websafeKey'):
+        # records written by the bulk export carry their old Session key
+        return _parseKey(record['websafeKey'], 'Session').parent()
+    raise ValueError("Session 'websafeConferenceKey' field required")
+
+
+def _sessionEntities(records):
+    """Return (parent key, new Session without a key), or a ValueError,
+    per record."""
+    conf_keys = []
+    for record in records:
+        try:
+            conf_keys.append(_sessionConferenceKey(record))
+        except ValueError as e:
+            conf_keys.append(e)
+    unique_keys = list(set(k for k in conf_keys if isinstance(k, ndb.Key)))
+    confs = dict(zip(unique_keys, ndb.get_multi(unique_keys)))
+
+    entities = []
+    for record, conf_key in zip(records, conf_keys):
+        try:
+            if isinstance(conf_key, ValueError):
+                raise conf_key
+            if not confs[conf_key]:
+                raise ValueError(
+                    'No conference found with key: %s' % conf_key.urlsafe())
+            entities.append((conf_key,
+                Session(**sessionData(record, confs[conf_key]))))
+        except RECORD_ERRORS as e:
+            entities.append(ValueError(e))
+    return entities
+
+
+def _allocateIds(model, entities):
+    """Allocate one id range per parent for the valid entities of a batch.
+
+    Returns a list with the id of each entity, None for invalid records.
+    """
+    by_parent = {}
+    for i, entity in enumerate(entities):
+        if isinstance(entity, tuple):
+            by_parent.setdefault(entity[0], []).append(i)
+    futures = [(indexes, model.allocate_ids_async(
+        size=len(indexes), parent=parent))
+        for parent, indexes in by_parent.items()]
+    ids = [None] * len(entities)
+    for indexes, future in futures:
+        first, last = future.get_result()
+        for i, new_id in zip(indexes, range(first, last + 1)):
+            ids[i] = new_id
+    return ids
+
+
+def _addSessionsToSpeakers(sessions):
+    """Add imported sessions to their Speakers, creating missing ones.
+
+    A session already listed is skipped, so a retried batch is harmless.
+    """
+    by_speaker = {}
+    for session in sessions:
+        by_speaker.setdefault(
+            normalizeSpeakerName(session.speaker), []).append(session)
+    sp_ids = by_speaker.keys()
+    sp_keys = [ndb.Key(Speaker, sp_id) for sp_id in sp_ids]
+    speakers = []
+    for sp_id, sp_key, speaker in zip(sp_ids, sp_keys, ndb.get_multi(sp_keys)):
+        sp_sessions = by_speaker[sp_id]
+        speaker = speaker or Speaker(key=sp_key, name=sp_sessions[0].speaker)
+        listed = set(speaker.sessionKeys)
+        for session in sp_sessions:
+            if session.key not in listed:
+                speaker.hosting_sessions.append(session.name)
+                speaker.sessionKeys.append(session.key)
+        speakers.append(speaker)
+    ndb.put_multi(speakers)
+
+
+def _invalidateConferenceCaches(conf_keys):
+    """Drop the cached session data of conferences that gained sessions."""
+    for conf_key in conf_keys:
+        invalidateSessionBuckets(conf_key)
+        invalidateFeaturedSpeaker(conf_key)
+    memcache.delete_multi([MEMCACHE_TIMELINE_PREFIX + conf_key.urlsafe()
+        for conf_key in conf_keys])
+
+
+def _importBatch(job, lines):
+    """Import one batch of NDJSON lines; returns its error messages and
+    the entities it wrote.
+
+    Ids are allocated and checkpointed on the job before any entity is
+    written, so a retried batch overwrites the entities it wrote before.
+    """
+    model = IMPORT_KINDS[job.kind]
+    # one parsed record per line; blank lines become None and are skipped
+    records = []
+    for line in lines:
+        try:
+            record = json.loads(line) if line.strip() else None
+            if record is not None and not isinstance(record, dict):
+                raise ValueError('Record is not a JSON object')
+            records.append(record)
+        except ValueError as e:
+            records.append(e)
+    build = _sessionEntities if model is Session else _conferenceEntities
+    built = iter(build([r for r in records if isinstance(r, dict)]))
+    entities = [next(built) if isinstance(r, dict) else r for r in records]
+
+    if job.pendingIds is None:
+        job.pendingIds = _allocateIds(model, entities)
+        job.put()
+    new_entities = []
+    errors = []
+    for i, (entity, new_id) in enumerate(zip(entities, job.pendingIds)):
+        if isinstance(entity, ValueError):
+            errors.append('%s:%d: %s' % (
+                job.chunks[job.chunkIndex], job.lineOffset + i + 1, entity))
+        elif entity:
+            parent, entity = entity
+            entity.key = ndb.Key(model, new_id, parent=parent)
+            new_entities.append(entity)
+    ndb.put_multi(new_entities)
+
+    if model is Session and new_entities:
+        _addSessionsToSpeakers(new_entities)
+        _invalidateConferenceCaches(
+            set(session.key.parent() for session in new_entities))
+    job.entityCount += len(new_entities)
+    return errors, new_entities
+
+
+def runImport(job_id, store=None):
+    """Import batches of a job's chunks until the task budget is spent.
+
+    The job is checkpointed after each batch; a retried task resumes from
+    the last checkpoint. Imported conferences are added to the conference
+    stats together with the checkpoint after their batch, so a retried
+    batch is counted once. Session imports finish by recounting
+    conference speakers, which also refreshes the featured speakers.
+    """
+    store = store or getBlobStore()
+    job = ImportJob.get_by_id(job_id)
+    if not job or job.status != 'RUNNING':
+        return job
+    deadline = time.time() + IMPORT_TASK_BUDGET_SECS
+
+    @ndb.transactional(xg=True)
+    def save(imported, last=False):
+        job.put()
+        if job.kind == 'Conference' and imported:
+            countImportedConferences(imported)
+        if not last:
+            return
+        if job.status == 'RUNNING':
+            taskqueue.add(params={'job': job_id}, url='/tasks/import',
+                transactional=True)
+        elif job.kind == 'Session':
+            taskqueue.add(url='/tasks/count_conference_speakers',
+                transactional=True)
+
+    lines = None
+    imported = []
+    while job.chunkIndex < len(job.chunks):
+        if lines is None:
+            lines = store.read(job.chunks[job.chunkIndex]).splitlines()
+        batch = lines[job.lineOffset:job.lineOffset + IMPORT_BATCH_SIZE]
+        imported = []
+        if batch:
+            errors, imported = _importBatch(job, batch)
+            job.errorCount += len(errors)
+            job.errors.extend(
+                errors[:max(0, IMPORT_MAX_ERRORS - len(job.errors))])
+        job.pendingIds = None
+        job.lineOffset += len(batch)
+        if job.lineOffset >= len(lines):
+            job.chunkIndex += 1
+            job.lineOffset = 0
+            lines = None
+        if time.time() >= deadline:
+            break
+        save(imported)
+        imported = []
+
+    if job.chunkIndex >= len(job.chunks):
+        job.status = 'DONE'
+    save(imported, last=True)
+    return job
+
+
+def importStatus(job):
+    """Return a JSON-compatible status dict for an ImportJob."""
+    return {
+        'jobId': job.key.id(),
+        'kind': job.kind,
+        'status': job.status,
+        'chunksDone': job.chunkIndex,
+        'chunks': len(job.chunks),
+        'entityCount': job.entityCount,
+        'errorCount': job.errorCount,
+        'errors': job.errors,
+        'created': job.created.isoformat(),
+        'updated': job.updated.isoformat(),
+    }
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+
+"""jobs.py
+
+Udacity conference server-side Python App Engine announcement, email,
+featured speaker and session cache logic shared by the API and the cron
+and task handlers; kept free of the Endpoints API module so task instances do not
+load it
+
+"""
+
+from google.appengine.api import app_identity
+from google.appengine.api import mail
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from cache import TieredCache
+from models import Conference
+from models import ConferenceSpeaker
+
+MEMCACHE_ANNOUNCEMENTS_KEY = "RECENT_ANNOUNCEMENTS"
+MEMCACHE_FEATURED_SPEAKER_PREFIX = "FEATURED_SPEAKER_"
+MEMCACHE_SESSION_INDEX_PREFIX = "CONF_SESSIONS_INDEX_"
+MEMCACHE_SESSION_FORMS_PREFIX = "CONF_SESSIONS_FORMS_"
+# other instances see a new announcement or featured speaker within
+# HOT_CACHE_TTL secs; the instance that wrote it sees it at once
+HOT_CACHE_TTL = 5
+
+# every request reads the announcement, and every conference page its
+# featured speaker
+_hotCache = TieredCache(max_size=1000, ttl=HOT_CACHE_TTL)
+
+
+# - - - Announcements - - - - - - - - - - - - - - - - - - - -
+
+def cacheAnnouncement():
+    """Create Announcement & assign to memcache; used by
+    memcache cron job & putAnnouncement().
+    """
+    confs = Conference.query(ndb.AND(
+        Conference.seatsAvailable <= 5,
+        Conference.seatsAvailable > 0)
+    ).fetch(projection=[Conference.name])
+
+    if confs:
+        # If there are almost sold out conferences,
+        # format announcement and set it in memcache
+        announcement = '%s %s' % (
+            'Last chance to attend! The following conferences '
+            'are nearly sold out:',
+            ', '.join(conf.name for conf in confs))
+        _hotCache.set(MEMCACHE_ANNOUNCEMENTS_KEY, announcement)
+    else:
+        # If there are no sold out conferences,
+        # delete the memcache announcements entry
+        announcement = ""
+        _hotCache.delete(MEMCACHE_ANNOUNCEMENTS_KEY)
+
+    return announcement
+
+
+def getAnnouncement():
+    """Return the announcement from memcache, or an empty string."""
+    return _hotCache.get(MEMCACHE_ANNOUNCEMENTS_KEY) or ""
+
+
+# - - - Emails - - - - - - - - - - - - - - - - - - - - - - - -
+
+def _sender():
+    return 'noreply@%s.appspotmail.com' % app_identity.get_application_id()
+
+
+def sendConfirmationEmail(email, conference_info):
+    """Send email confirming Conference creation."""
+    mail.send_mail(
+        _sender(),                                      # from
+        email,                                          # to
+        'You created a new Conference!',                # subj
+        'Hi, you have created a following '             # body
+        'conference:\r\n\r\n%s' % conference_info
+    )
+
+
+def sendSessionEmail(email, session_info):
+    """Send email confirming Session creation."""
+    message = mail.EmailMessage(sender=_sender(),
+        to=email,
+        subject='You created a new session!',
+        body='Hi, you have created the session:\r\n\r\n%s' % session_info)
+    message.send()
+
+
+# - - - Featured speakers - - - - - - - - - - - - - - - - - -
+
+def formatFeaturedSpeaker(conf_speaker):
+    """Return the featured speaker announcement of a ConferenceSpeaker."""
+    return '%s is hosting sessions: %s' % (
+        conf_speaker.name, ', '.join(conf_speaker.sessionNames))
+
+
+def cacheFeaturedSpeaker(conf_key, speaker):
+    """Sets a conference's featured speaker in memcache"""
+    _hotCache.set(MEMCACHE_FEATURED_SPEAKER_PREFIX + conf_key.urlsafe(),
+        speaker)
+    return speaker
+
+
+def invalidateFeaturedSpeaker(conf_key):
+    """Drop a conference's cached featured speaker."""
+    _hotCache.delete(MEMCACHE_FEATURED_SPEAKER_PREFIX + conf_key.urlsafe())
+
+
+def getFeaturedSpeaker(conf_key):
+    """Returns a conference's featured speaker, from memcache if possible"""
+    speaker = _hotCache.get(
+        MEMCACHE_FEATURED_SPEAKER_PREFIX + conf_key.urlsafe())
+    if speaker is None:
+        # most recently featured speaker of the conference, if any
+        conf_speaker = ConferenceSpeaker.query(ancestor=conf_key).order(
+            -ConferenceSpeaker.lastFeatured).get()
+        speaker = ''
+        if conf_speaker and conf_speaker.lastFeatured:
+            speaker = formatFeaturedSpeaker(conf_speaker)
+        cacheFeaturedSpeaker(conf_key, speaker)
+    return speaker
+
+
+# - - - Session lists - - - - - - - - - - - - - - - - - - - -
+
+def invalidateSessionBuckets(conf_key):
+    """Drop a conference's cached session index and forms."""
+    wsck = conf_key.urlsafe()
+    memcache.delete_multi([MEMCACHE_SESSION_INDEX_PREFIX + wsck,
+        MEMCACHE_SESSION_FORMS_PREFIX + wsck])
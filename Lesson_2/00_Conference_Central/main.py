@@ -10,63 +10,260 @@ created by wesc on 2014 may 24
 
 """
 
+import json
+import logging
+import os
+import time
+
 import webapp2
-from google.appengine.api import app_identity
-from google.appengine.api import mail
 from google.appengine.api import memcache
 
-from conference import ConferenceApi
+from batch import batchStatus
+from batch import runBatch
+from batch import startBatch
+from batch import startShards
+from export import exportStatus
+from export import runExport
+from export import startExport
+from jobs import MEMCACHE_ANNOUNCEMENTS_KEY
+from jobs import cacheAnnouncement
+from jobs import getAnnouncement
+from jobs import sendConfirmationEmail
+from jobs import sendSessionEmail
+# register their batch mappers
+import migrations
+import stats
+from models import BatchJob
+from models import ExportJob
+from models import ImportJob
+from recommend import runRecommendations
+from recommend import startRecommendations
+from storage import getBlobStore
+
+INDEX_TEMPLATE = os.path.join(os.path.dirname(__file__), 'templates',
+    'index.html')
+MEMCACHE_INDEX_PREFIX = "INDEX_HTML_"
+INDEX_CACHE_TTL = 60
+# the page size of the conference list in static/js/controllers.js
+INDEX_CONFERENCES_PAGE_SIZE = 20
+
+# The Endpoints API module (conference, and importer which uses it) builds
+# the API config when it is imported, so it is imported only by the
+# handlers that need it; cron and task instances never load it.
+
+
+def renderIndex():
+    """Return index.html with the announcement and the first page of
+    conferences inlined as BOOTSTRAP_DATA, so the client can paint them
+    before the Google API client has loaded."""
+    from protorpc import protojson
+    from conference import ConferenceApi
+    from models import QueryForms
+    api = ConferenceApi()
+    announcement = getAnnouncement()
+    conferences = api.queryConferences(
+        QueryForms(pageSize=INDEX_CONFERENCES_PAGE_SIZE))
+    data = '{"announcement": %s, "conferences": %s}' % (
+        json.dumps(announcement), protojson.encode_message(conferences))
+    with open(INDEX_TEMPLATE) as f:
+        html = f.read()
+    # keep '</script>' in the data from closing the script element
+    return html.replace('<!-- bootstrap data -->',
+        '<script>var BOOTSTRAP_DATA = %s;</script>'
+        % data.replace('</', '<\\/'))
+
 
-MEMCACHE_FEATURED_SPEAKER_KEY = "FEATURED_SPEAKER"
+def getIndex():
+    """Return the rendered index.html, rendering it at most once a minute
+    per app version."""
+    cache_key = MEMCACHE_INDEX_PREFIX + os.getenv('CURRENT_VERSION_ID', '')
+    html = memcache.get(cache_key)
+    if html is None:
+        html = renderIndex()
+        memcache.set(cache_key, html, time=INDEX_CACHE_TTL)
+    return html
+
+
+def warmUp():
+    """Prime a new instance before it serves user requests.
+
+    Only what main.app serves is warmed: memcache gets the announcement
+    and the rendered index page, which holds the first page of
+    conferences. The Endpoints API module and the token verification
+    code stay lazily imported, so the instance does not load them unless
+    it serves an API request. Returns the seconds spent on each step.
+    """
+    timings = []
+    start = time.time()
+    if memcache.get(MEMCACHE_ANNOUNCEMENTS_KEY) is None:
+        cacheAnnouncement()
+    getIndex()
+    timings.append(('memcache', time.time() - start))
+    return timings
+
+
+class IndexHandler(webapp2.RequestHandler):
+    def get(self):
+        """Serve index.html with its bootstrap data."""
+        html = getIndex()
+        # the page names the current asset bundles, so always revalidate it
+        self.response.cache_control = 'no-cache'
+        self.response.write(html)
+
+
+class WarmupHandler(webapp2.RequestHandler):
+    def get(self):
+        """Warm up a new instance."""
+        timings = warmUp()
+        logging.info('Warmed up: %s', ', '.join(
+            '%s %.0f ms' % (step, secs * 1000) for step, secs in timings))
 
 
 class SetAnnouncementHandler(webapp2.RequestHandler):
     def get(self):
         """Set Announcement in Memcache."""
-        # use _cacheAnnouncement() to set announcement in Memcache
-        ConferenceApi._cacheAnnouncement()
+        # use cacheAnnouncement() to set announcement in Memcache
+        cacheAnnouncement()
 
 
 class SendConfirmationEmailHandler(webapp2.RequestHandler):
     def post(self):
         """Send email confirming Conference creation."""
-        mail.send_mail(
-            'noreply@%s.appspotmail.com' % (
-                app_identity.get_application_id()),     # from
-            self.request.get('email'),                  # to
-            'You created a new Conference!',            # subj
-            'Hi, you have created a following '         # body
-            'conference:\r\n\r\n%s' % self.request.get(
-                'conferenceInfo')
-        )
+        sendConfirmationEmail(self.request.get('email'),
+            self.request.get('conferenceInfo'))
 
 
 class SendSessionEmailHandler(webapp2.RequestHandler):
     def post(self):
         """Send email confirming Session creation."""
-        message = mail.EmailMessage(sender='noreply@%s.appspotmail.com' % 
-            (app_identity.get_application_id()),
-            to=self.request.get('email'),                  
-            subject='You created a new session!',   
-            body='Hi, you have created the session:\r\n\r\n%s' %
+        sendSessionEmail(self.request.get('email'),
             self.request.get('sessionInfo'))
-        message.send()
 
 
-class SetFeaturedSpeakerHandler(webapp2.RequestHandler):
+class StartBatchHandler(webapp2.RequestHandler):
+    def get(self, name):
+        """Start the batch job name over one key range."""
+        startBatch(name)
+
+    def post(self, name):
+        """Start the batch job name when enqueued as a task."""
+        startBatch(name)
+
+
+class BatchHandler(webapp2.RequestHandler):
     def post(self):
-        """Set featured speaker in memcache"""
-        speaker = self.request.get('speaker')
-        #ConferenceApi._cacheFeaturedSpeaker(speaker)
-        if speaker:
-            memcache.set(MEMCACHE_FEATURED_SPEAKER_KEY, speaker)
+        """Start the shards of a batch job, or run one batch of a shard."""
+        if self.request.get('job'):
+            startShards(int(self.request.get('job')))
         else:
-            memcache.delete(MEMCACHE_FEATURED_SPEAKER_KEY)
+            runBatch(self.request.get('shard'))
+
+
+class AdminBatchHandler(webapp2.RequestHandler):
+    def post(self):
+        """Start the batch job named in 'name', split into 'shards' key
+        ranges run in parallel."""
+        try:
+            job = startBatch(self.request.get('name'),
+                self.request.get('shards') or 1)
+        except ValueError as e:
+            self.abort(400, str(e))
+        self.response.content_type = 'application/json'
+        self.response.write(json.dumps(batchStatus(job)))
+
+    def get(self, job_id):
+        """Return the status of a batch job."""
+        job = BatchJob.get_by_id(int(job_id))
+        if not job:
+            self.abort(404)
+        self.response.content_type = 'application/json'
+        self.response.write(json.dumps(batchStatus(job)))
+
+
+class RecommendationsHandler(webapp2.RequestHandler):
+    def get(self):
+        """Start rebuilding the recommended conferences."""
+        startRecommendations()
+
+    def post(self):
+        """Run the next batch of a recommendation job."""
+        runRecommendations(int(self.request.get('job')))
+
+
+class ExportHandler(webapp2.RequestHandler):
+    def post(self):
+        """Write the next chunks of a bulk export job."""
+        runExport(int(self.request.get('job')))
+
+
+class AdminExportHandler(webapp2.RequestHandler):
+    def post(self):
+        """Start a bulk NDJSON export of the kind given in 'kind'."""
+        try:
+            job = startExport(self.request.get('kind'))
+        except ValueError as e:
+            self.abort(400, str(e))
+        self.response.content_type = 'application/json'
+        self.response.write(json.dumps(exportStatus(job)))
+
+    def get(self, job_id):
+        """Return the status of an export job, with its manifest once done."""
+        job = ExportJob.get_by_id(int(job_id))
+        if not job:
+            self.abort(404)
+        status = exportStatus(job)
+        if job.manifest:
+            status['manifest'] = json.loads(getBlobStore().read(job.manifest))
+        self.response.content_type = 'application/json'
+        self.response.write(json.dumps(status))
+
+
+class ImportHandler(webapp2.RequestHandler):
+    def post(self):
+        """Import the next batches of a bulk import job."""
+        from importer import runImport
+        runImport(int(self.request.get('job')))
+
+
+class AdminImportHandler(webapp2.RequestHandler):
+    def post(self):
+        """Start a bulk NDJSON import of the manifest named in 'manifest'."""
+        from importer import importStatus
+        from importer import startImport
+        try:
+            job = startImport(self.request.get('manifest'))
+        except (IOError, ValueError) as e:
+            self.abort(400, str(e))
+        self.response.content_type = 'application/json'
+        self.response.write(json.dumps(importStatus(job)))
+
+    def get(self, job_id):
+        """Return the status of an import job."""
+        from importer import importStatus
+        job = ImportJob.get_by_id(int(job_id))
+        if not job:
+            self.abort(404)
+        self.response.content_type = 'application/json'
+        self.response.write(json.dumps(importStatus(job)))
 
 
 app = webapp2.WSGIApplication([
+    ('/', IndexHandler),
+    ('/_ah/warmup', WarmupHandler),
     ('/crons/set_announcement', SetAnnouncementHandler),
     ('/tasks/send_confirmation_email', SendConfirmationEmailHandler),
     ('/tasks/send_session_email', SendSessionEmailHandler),
-    ('/tasks/set_featured_speaker', SetFeaturedSpeakerHandler)
+    (r'/tasks/(backfill_calendar_buckets|backfill_profile_emails'
+        r'|migrate_speaker_sessions|rekey_speakers|count_conference_speakers'
+        r'|slim_sessions|rebuild_conference_stats)', StartBatchHandler),
+    ('/tasks/batch', BatchHandler),
+    ('/admin/batch', AdminBatchHandler),
+    (r'/admin/batch/(\d+)', AdminBatchHandler),
+    ('/tasks/recommendations', RecommendationsHandler),
+    ('/tasks/export', ExportHandler),
+    ('/admin/export', AdminExportHandler),
+    (r'/admin/export/(\d+)', AdminExportHandler),
+    ('/tasks/import', ImportHandler),
+    ('/admin/import', AdminImportHandler),
+    (r'/admin/import/(\d+)', AdminImportHandler)
 ], debug=True)
\ No newline at end of file
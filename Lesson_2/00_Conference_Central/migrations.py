@@ -0,0 +1,195 @@
+#!/usr/bin/env python
+
+"""migrations.py
+
+Udacity conference server-side Python App Engine data migrations, run
+as batch jobs; start one with startBatch(name), or by visiting its
+/tasks/<name> url as an admin
+
+"""
+
+import logging
+from datetime import datetime
+
+from google.appengine.ext import ndb
+
+from batch import BatchMapper
+from batch import mapper
+from jobs import cacheFeaturedSpeaker
+from jobs import formatFeaturedSpeaker
+from models import Conference
+from models import Profile
+from models import ConferenceSpeaker
+from models import Session
+from models import Speaker
+
+from utils import calendarBuckets
+from utils import normalizeEmail
+from utils import normalizeSpeakerName
+
+
+@mapper
+class BackfillCalendarBuckets(BatchMapper):
+    """Derive Conference.yearMonth and isoWeek from startDate for
+    conferences stored before they existed."""
+    name = 'backfill_calendar_buckets'
+
+    def query(self):
+        return Conference.query()
+
+    def process(self, confs, totals):
+        changed = []
+        for conf in confs:
+            buckets = calendarBuckets(conf.startDate)
+            if any(getattr(conf, name) != value
+                    for name, value in buckets.items()):
+                conf.populate(**buckets)
+                changed.append(conf)
+        return changed, []
+
+
+@mapper
+class BackfillProfileEmails(BatchMapper):
+    """Set Profile.normalizedEmail for profiles stored before it existed,
+    so getUserId(id_type='custom') finds them by email."""
+    name = 'backfill_profile_emails'
+
+    def query(self):
+        return Profile.query()
+
+    def process(self, profiles, totals):
+        changed = []
+        for profile in profiles:
+            email = profile.mainEmail and normalizeEmail(profile.mainEmail)
+            if profile.normalizedEmail != email:
+                profile.normalizedEmail = email
+                changed.append(profile)
+        return changed, []
+
+
+@mapper
+class MigrateSpeakerSessions(BatchMapper):
+    """Fill Speaker.sessionKeys from the sessions naming each speaker."""
+    name = 'migrate_speaker_sessions'
+
+    def query(self):
+        return Speaker.query()
+
+    def process(self, speakers, totals):
+        futures = [Session.query(Session.speaker == speaker.name).fetch_async(
+            keys_only=True) for speaker in speakers]
+        for speaker, future in zip(speakers, futures):
+            speaker.sessionKeys = future.get_result()
+        return speakers, []
+
+
+@ndb.transactional(xg=True)
+def _rekeySpeaker(old_key):
+    """Merge a Speaker with an allocated id into its normalized-name key."""
+    old = old_key.get()
+    if not old:
+        return
+    new_key = ndb.Key(Speaker, normalizeSpeakerName(old.name))
+    speaker = new_key.get() or Speaker(key=new_key, name=old.name)
+    for name in old.hosting_sessions:
+        if name not in speaker.hosting_sessions:
+            speaker.hosting_sessions.append(name)
+    for s_key in old.sessionKeys:
+        if s_key not in speaker.sessionKeys:
+            speaker.sessionKeys.append(s_key)
+    speaker.put()
+    old_key.delete()
+
+
+@mapper
+class RekeySpeakers(BatchMapper):
+    """Move Speakers with allocated ids to keys built from their names."""
+    name = 'rekey_speakers'
+    keys_only = True
+
+    def query(self):
+        return Speaker.query()
+
+    def process(self, keys, totals):
+        for key in keys:
+            # speakers already keyed by name have string ids
+            if isinstance(key.id(), (int, long)):
+                _rekeySpeaker(key)
+                totals['rekeyed'] = totals.get('rekeyed', 0) + 1
+        return [], []
+
+
+@mapper
+class CountConferenceSpeakers(BatchMapper):
+    """Rebuild the ConferenceSpeaker session counts of each conference,
+    and cache its featured speaker."""
+    name = 'count_conference_speakers'
+    keys_only = True
+
+    def query(self):
+        return Conference.query()
+
+    def process(self, conf_keys, totals):
+        futures = [Session.query(ancestor=c_key).fetch_async()
+            for c_key in conf_keys]
+        conf_speakers = []
+        for c_key, future in zip(conf_keys, futures):
+            by_speaker = {}
+            for session in future.get_result():
+                if not session.speaker:
+                    continue
+                cs_id = normalizeSpeakerName(session.speaker)
+                if cs_id not in by_speaker:
+                    by_speaker[cs_id] = ConferenceSpeaker(
+                        id=cs_id, parent=c_key, name=session.speaker)
+                by_speaker[cs_id].sessionNames.append(session.name)
+                by_speaker[cs_id].sessionCount += 1
+            featured = ''
+            for conf_speaker in by_speaker.values():
+                if conf_speaker.sessionCount > 1:
+                    conf_speaker.lastFeatured = datetime.now()
+                    featured = formatFeaturedSpeaker(conf_speaker)
+            cacheFeaturedSpeaker(c_key, featured)
+            conf_speakers.extend(by_speaker.values())
+        return conf_speakers, []
+
+
+def _indexedValues(entity):
+    """Return (indexed property values, encoded size) of an entity."""
+    pb = entity._to_pb()
+    return len(pb.property_list()), len(pb.Encode())
+
+
+@mapper
+class SlimSessions(BatchMapper):
+    """Rewrite Sessions without the properties once inherited from
+    Conference, tallying indexed values and bytes before and after."""
+    name = 'slim_sessions'
+    TOTALS = ('indexedBefore', 'indexedAfter', 'bytesBefore', 'bytesAfter')
+
+    def query(self):
+        return Session.query()
+
+    def process(self, sessions, totals):
+        totals.update((name, 0) for name in self.TOTALS)
+        for session in sessions:
+            indexed, size = _indexedValues(session)
+            totals['indexedBefore'] += indexed
+            totals['bytesBefore'] += size
+            # properties unknown to the model are kept on the instance
+            # when it is loaded; drop them so the put no longer writes them
+            for name in session._properties.keys():
+                if name not in Session._properties:
+                    del session._properties[name]
+                    session._values.pop(name, None)
+            indexed, size = _indexedValues(session)
+            totals['indexedAfter'] += indexed
+            totals['bytesAfter'] += size
+        return sessions, []
+
+    def finish(self, job, totals):
+        # every indexed value costs two index rows (ascending, descending)
+        logging.info('Slimmed %d sessions: indexed values %d -> %d '
+            '(index rows x2), bytes %d -> %d', totals.get('processed', 0),
+            totals.get('indexedBefore', 0), totals.get('indexedAfter', 0),
+            totals.get('bytesBefore', 0), totals.get('bytesAfter', 0))
@@ -11,8 +11,6 @@ created/forked from conferences.py by wesc on 2014 may 24
 """
 
 
-import httplib
-import endpoints
 from protorpc import messages
 from google.appengine.ext import ndb
 
@@ -21,11 +19,17 @@ class Profile(ndb.Model):
     """Profile -- User profile object"""
     displayName             = ndb.StringProperty()
     mainEmail               = ndb.StringProperty()
+    normalizedEmail         = ndb.StringProperty()
     teeShirtSize            = ndb.StringProperty(default='NOT_SPECIFIED')
     conferenceKeysToAttend  = ndb.StringProperty(repeated=True)
     session_wishlist        = ndb.StringProperty(repeated=True)
 
 
+class UserIdentity(ndb.Model):
+    """UserIdentity -- maps a normalized email (the key name) to a user id"""
+    userId                  = ndb.StringProperty(required=True, indexed=False)
+
+
 class ProfileMiniForm(messages.Message):
     """ProfileMiniForm -- update Profile form message"""
     displayName        = messages.StringField(1)
@@ -70,6 +74,8 @@ class Conference(ndb.Model):
     city            = ndb.StringProperty()
     startDate       = ndb.DateProperty()
     month           = ndb.IntegerProperty()
+    yearMonth       = ndb.IntegerProperty() # e.g. 201706, from startDate
+    isoWeek         = ndb.IntegerProperty() # e.g. 201723, from startDate
     endDate         = ndb.DateProperty()
     maxAttendees    = ndb.IntegerProperty()
     seatsAvailable  = ndb.IntegerProperty()
@@ -92,6 +98,7 @@ class ConferenceForm(messages.Message):
 class ConferenceForms(messages.Message):
     """ConferenceForms -- multiple Conference outbound form message"""
     items = messages.MessageField(ConferenceForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
 
 class QueryForm(messages.Message):
     """ConferenceQueryForm -- Conference query inbound form message"""
@@ -102,25 +109,23 @@ class QueryForm(messages.Message):
 class QueryForms(messages.Message):
     """ConferenceQueryForms -- multiple ConferenceQueryForm inbound form message"""
     filters = messages.MessageField(QueryForm, 1, repeated=True)
+    pageSize = messages.IntegerField(2, variant=messages.Variant.INT32)
+    pageToken = messages.StringField(3)
 
 # needed for conference registration
 class BooleanMessage(messages.Message):
     """BooleanMessage-- outbound Boolean value message"""
     data = messages.BooleanField(1)
 
-class ConflictException(endpoints.ServiceException):
-    """ConflictException -- exception mapped to HTTP 409 response"""
-    http_status = httplib.CONFLICT
-
 class StringMessage(messages.Message):
     """StringMessage-- outbound (single) string message"""
     data = messages.StringField(1, required=True)
 
-class Session(Conference):
-    """Session - conference session object"""
+class Session(ndb.Model):
+    """Session - conference session object, child of its Conference"""
     name            = ndb.StringProperty(required=True)
     highlights      = ndb.StringProperty(repeated=True)
-    date            = ndb.DateProperty()
+    date            = ndb.DateProperty(indexed=False)
     start_time      = ndb.IntegerProperty() #should be given in 24hr time
     duration        = ndb.IntegerProperty() #should be given in minutes
     speaker         = ndb.StringProperty()
@@ -140,11 +145,36 @@ class SessionForm(messages.Message):
 class SessionForms(messages.Message):
     """SessionForms -- multiple Session outbound form message"""
     items = messages.MessageField(SessionForm, 1, repeated=True)
+    nextPageToken = messages.StringField(2)
+
+class AgendaItemForm(messages.Message):
+    """AgendaItemForm -- one conference or session of a user's agenda"""
+    kind            = messages.StringField(1)   # CONFERENCE or SESSION
+    name            = messages.StringField(2)
+    websafeKey      = messages.StringField(3)
+    start           = messages.StringField(4)   # YYYY-MM-DDTHH:MM
+    end             = messages.StringField(5)
+    conflictsWith   = messages.StringField(6, repeated=True)
+
+class AgendaForm(messages.Message):
+    """AgendaForm -- a user's agenda in chronological order"""
+    items = messages.MessageField(AgendaItemForm, 1, repeated=True)
 
 class Speaker(ndb.Model):
     """Speaker -- Session speaker object"""
     name                = ndb.StringProperty(required=True)
     hosting_sessions    = ndb.StringProperty(repeated=True)
+    sessionKeys         = ndb.KeyProperty(kind='Session', repeated=True,
+                                          indexed=False)
+
+class ConferenceSpeaker(ndb.Model):
+    """ConferenceSpeaker -- a speaker's sessions within one conference;
+    child of Conference, keyed by normalized speaker name"""
+    name                = ndb.StringProperty(required=True, indexed=False)
+    sessionNames        = ndb.StringProperty(repeated=True, indexed=False)
+    sessionCount        = ndb.IntegerProperty(default=0, indexed=False)
+    # set whenever the speaker becomes featured (hosts 2+ sessions)
+    lastFeatured        = ndb.DateTimeProperty()
 
 class SpeakerForm(messages.Message):
     """SpeakerForm -- Speaker outbound form message"""
@@ -153,4 +183,101 @@ class SpeakerForm(messages.Message):
 
 class SpeakerQueryForm(messages.Message):
     """SpeakerQueryForm -- Speaker query inbound form message"""
-    name = messages.StringField(1)
\ No newline at end of file
+    name = messages.StringField(1)
+    pageSize = messages.IntegerField(2, variant=messages.Variant.INT32)
+    pageToken = messages.StringField(3)
+
+class ExportJob(ndb.Model):
+    """ExportJob -- progress of a bulk NDJSON export of one kind"""
+    kind            = ndb.StringProperty(required=True)
+    status          = ndb.StringProperty(default='RUNNING')
+    cursor          = ndb.StringProperty(indexed=False)
+    chunks          = ndb.JsonProperty()    # [{name, count}]
+    entityCount     = ndb.IntegerProperty(default=0, indexed=False)
+    manifest        = ndb.StringProperty(indexed=False)
+    created         = ndb.DateTimeProperty(auto_now_add=True)
+    updated         = ndb.DateTimeProperty(auto_now=True)
+
+class ImportJob(ndb.Model):
+    """ImportJob -- progress of a bulk NDJSON import of one kind"""
+    kind            = ndb.StringProperty(required=True)
+    status          = ndb.StringProperty(default='RUNNING')
+    chunks          = ndb.StringProperty(repeated=True, indexed=False)
+    chunkIndex      = ndb.IntegerProperty(default=0, indexed=False)
+    lineOffset      = ndb.IntegerProperty(default=0, indexed=False)
+    pendingIds      = ndb.JsonProperty()    # ids allocated for next batch
+    entityCount     = ndb.IntegerProperty(default=0, indexed=False)
+    errorCount      = ndb.IntegerProperty(default=0, indexed=False)
+    errors          = ndb.StringProperty(repeated=True, indexed=False)
+    created         = ndb.DateTimeProperty(auto_now_add=True)
+    updated         = ndb.DateTimeProperty(auto_now=True)
+
+class ConferenceStatsShard(ndb.Model):
+    """ConferenceStatsShard -- one shard of the aggregate conference counts"""
+    # {bucket: [conferences, seats, registrations]}; buckets are '' for
+    # all conferences, 'city:<city>' and 'month:<month>'
+    counts          = ndb.JsonProperty()
+    updated         = ndb.DateTimeProperty(auto_now=True)
+
+class StatsBucketForm(messages.Message):
+    """StatsBucketForm -- conference counts of one city or month"""
+    name            = messages.StringField(1)
+    conferences     = messages.IntegerField(2)
+    seats           = messages.IntegerField(3)
+    registrations   = messages.IntegerField(4)
+
+class ConferenceStatsForm(messages.Message):
+    """ConferenceStatsForm -- aggregate conference counts outbound form message"""
+    conferences     = messages.IntegerField(1)
+    seats           = messages.IntegerField(2)
+    registrations   = messages.IntegerField(3)
+    byCity          = messages.MessageField(StatsBucketForm, 4, repeated=True)
+    byMonth         = messages.MessageField(StatsBucketForm, 5, repeated=True)
+
+class RecommendationJob(ndb.Model):
+    """RecommendationJob -- progress of a recommendation build, whose working
+    data are its RecommendationConference and RecommendationTopic children"""
+    stage           = ndb.StringProperty(default='conferences')
+    status          = ndb.StringProperty(default='RUNNING')
+    cursor          = ndb.StringProperty(indexed=False)
+    created         = ndb.DateTimeProperty(auto_now_add=True)
+    updated         = ndb.DateTimeProperty(auto_now=True)
+
+class RecommendationConference(ndb.Model):
+    """RecommendationConference -- recommendation working data of the
+    conference whose websafe key is the key name"""
+    topics          = ndb.StringProperty(repeated=True)
+    # {websafe conference key: shared attendees}
+    coAttendance    = ndb.JsonProperty(compressed=True)
+
+class RecommendationTopic(ndb.Model):
+    """RecommendationTopic -- recommendation working data of the topic that
+    is the key name"""
+    # {topic: conferences or attendees with both}
+    pairs           = ndb.JsonProperty(compressed=True)
+
+class RecommendedConferences(ndb.Model):
+    """RecommendedConferences -- most similar conferences of the conference
+    whose websafe key is the key name, best first"""
+    conferenceKeys  = ndb.KeyProperty(kind=Conference, repeated=True,
+                                      indexed=False)
+    updated         = ndb.DateTimeProperty(auto_now=True)
+
+class BatchJob(ndb.Model):
+    """BatchJob -- a batch job over a whole kind, run by one or more shards"""
+    name            = ndb.StringProperty(required=True)
+    status          = ndb.StringProperty(default='RUNNING')
+    shards          = ndb.IntegerProperty(default=1, indexed=False)
+    shardsDone      = ndb.IntegerProperty(default=0, indexed=False)
+    created         = ndb.DateTimeProperty(auto_now_add=True)
+    updated         = ndb.DateTimeProperty(auto_now=True)
+
+class BatchShard(ndb.Model):
+    """BatchShard -- progress of one key range of a BatchJob"""
+    job             = ndb.KeyProperty(kind=BatchJob, required=True)
+    status          = ndb.StringProperty(default='RUNNING')
+    keyStart        = ndb.KeyProperty(indexed=False)    # inclusive
+    keyEnd          = ndb.KeyProperty(indexed=False)    # exclusive
+    cursor          = ndb.StringProperty(indexed=False)
+    totals          = ndb.JsonProperty()    # {counter: value}
+    updated         = ndb.DateTimeProperty(auto_now=True)
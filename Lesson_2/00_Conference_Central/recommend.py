@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+
+"""recommend.py
+
+Udacity conference server-side Python App Engine conference
+recommendations; a nightly job of chained tasks builds a topic
+co-occurrence matrix from conference topics and registrations and stores
+the most similar conferences of each conference. The working data are
+kept in child entities of the job, one per conference and per topic
+
+"""
+
+import heapq
+import math
+
+from google.appengine.api import taskqueue
+from google.appengine.datastore.datastore_query import Cursor
+from google.appengine.ext import ndb
+
+from cache import LRUCache
+from models import Conference
+from models import Profile
+from models import RecommendationConference
+from models import RecommendationJob
+from models import RecommendationTopic
+from models import RecommendedConferences
+from validation import DEFAULTS
+
+# conferences or profiles read per task; their working data are written
+# in one transaction, which commits at most 500 entities, so a batch
+# ends early once it would write more than MAX_ROWS_PER_SAVE
+RECOMMEND_BATCH_SIZE = 100
+MAX_ROWS_PER_SAVE = 400
+RANK_BATCH_SIZE = 100
+RECOMMENDATIONS_PER_CONFERENCE = 10
+# conferences created without topics get the default ones, which say
+# nothing about them
+IGNORED_TOPICS = frozenset(DEFAULTS['topics'])
+
+# the topic similarities and conference topics of a job's rank stage;
+# they do not change during the stage, so an instance loads them once
+_rankData = LRUCache(max_size=1, ttl=3600)
+
+
+def startRecommendations():
+    """Create a RecommendationJob and enqueue its first task."""
+    job = RecommendationJob()
+
+    @ndb.transactional()
+    def create():
+        job.put()
+        taskqueue.add(params={'job': job.key.id()},
+            url='/tasks/recommendations', transactional=True)
+    create()
+    return job
+
+
+def _countPairs(pairs, topics):
+    """Count every pair of topics, each topic with itself included."""
+    for t in topics:
+        row = pairs.setdefault(t, {})
+        for u in topics:
+            row[u] = row.get(u, 0) + 1
+
+
+def _addPairs(job, pairs):
+    """Return the RecommendationTopics of job with pairs added to them."""
+    keys = [ndb.Key(RecommendationTopic, t, parent=job.key) for t in pairs]
+    topics = []
+    for key, topic in zip(keys, ndb.get_multi(keys)):
+        topic = topic or RecommendationTopic(key=key, pairs={})
+        for u, n in pairs[key.id()].items():
+            topic.pairs[u] = topic.pairs.get(u, 0) + n
+        topics.append(topic)
+    return topics
+
+
+def _fetchPage(query, job, size):
+    """Fetch the job's next batch of query; returns the entities and the
+    cursor after each, None after the last entity of the query."""
+    start_cursor = Cursor(urlsafe=job.cursor) if job.cursor else None
+    it = query.iter(start_cursor=start_cursor, produce_cursors=True,
+        batch_size=size + 1)
+    entities, cursors = [], []
+    for entity in it:
+        if len(entities) == size:
+            break
+        entities.append(entity)
+        cursors.append(it.cursor_after())
+    else:
+        if cursors:
+            cursors[-1] = None
+    return entities, cursors
+
+
+def _advance(job, cursors, count):
+    """Move job.cursor past the first count entities of a batch."""
+    cursor = cursors[count - 1] if count else None
+    job.cursor = cursor.urlsafe() if cursor else None
+
+
+def _scanConferences(job):
+    """Record the topics of a batch of conferences and count their pairs."""
+    confs, cursors = _fetchPage(Conference.query(), job,
+        RECOMMEND_BATCH_SIZE)
+    rows, pairs = [], {}
+    for conf in confs:
+        topics = sorted(set(t for t in conf.topics if t) - IGNORED_TOPICS)
+        if rows and len(rows) + 1 + len(set(pairs).union(topics)) > \
+                MAX_ROWS_PER_SAVE:
+            break
+        rows.append(RecommendationConference(id=conf.key.urlsafe(),
+            parent=job.key, topics=topics, coAttendance={}))
+        _countPairs(pairs, topics)
+    _advance(job, cursors, len(rows))
+    if not job.cursor:
+        job.stage = 'profiles'
+    return rows + _addPairs(job, pairs), []
+
+
+def _scanProfiles(job):
+    """Count the conferences and topics a batch of attendees share."""
+    profiles, cursors = _fetchPage(Profile.query(), job,
+        RECOMMEND_BATCH_SIZE)
+    attendees = [set(prof.conferenceKeysToAttend) for prof in profiles]
+    keys = [ndb.Key(RecommendationConference, wsck, parent=job.key)
+        for wsck in set().union(*attendees)]
+    loaded = dict((row.key.id(), row) for row in ndb.get_multi(keys) if row)
+    rows, pairs = {}, {}
+    done = 0
+    for attended in attendees:
+        attended = [wsck for wsck in attended if wsck in loaded]
+        # an attendee's topics co-occur across their conferences
+        topics = set(topic for wsck in attended
+            for topic in loaded[wsck].topics)
+        if done and len(set(rows).union(attended)) + \
+                len(set(pairs).union(topics)) > MAX_ROWS_PER_SAVE:
+            break
+        for wsck in attended:
+            row = rows.setdefault(wsck, loaded[wsck]).coAttendance
+            for other in attended:
+                if other != wsck:
+                    row[other] = row.get(other, 0) + 1
+        _countPairs(pairs, topics)
+        done += 1
+    _advance(job, cursors, done)
+    if not job.cursor:
+        job.stage = 'rank'
+    return rows.values() + _addPairs(job, pairs), []
+
+
+def _topicSimilarities(pairs):
+    """Return {topic: {topic: co-occurrences / geometric mean of the
+    occurrences of both}}, 1.0 for a topic with itself."""
+    return dict((t, dict((u, n / math.sqrt(row[t] * pairs[u][u]))
+        for u, n in row.items())) for t, row in pairs.items())
+
+
+def _similar(row, conf_topics, sims):
+    """Return the websafe keys of the conferences most similar to the
+    conference of a RecommendationConference.
+
+    Each shared attendee scores 1; topic similarity, the mean over the
+    topic pairs of both conferences, adds up to 1 more and ranks
+    conferences nobody has registered for yet.
+    """
+    wsck = row.key.id()
+    shared = row.coAttendance or {}
+    scored = []
+    for other in set(conf_topics) | set(shared):
+        if other == wsck:
+            continue
+        score = shared.get(other, 0)
+        other_topics = conf_topics.get(other)
+        if row.topics and other_topics:
+            score += sum(sims[t].get(u, 0) for t in row.topics
+                for u in other_topics) / (len(row.topics) * len(other_topics))
+        if score > 0:
+            scored.append((score, other))
+    return [other for score, other in heapq.nlargest(
+        RECOMMENDATIONS_PER_CONFERENCE, scored)]
+
+
+def _loadRankData(job):
+    """Return the topic similarities and the topics of every conference
+    of job, as (sims, conf_topics)."""
+    data = _rankData.get(job.key.id())
+    if data is None:
+        sims = _topicSimilarities(dict((topic.key.id(), topic.pairs)
+            for topic in RecommendationTopic.query(ancestor=job.key)))
+        # a projection on a repeated property returns one result per value
+        conf_topics = {}
+        for row in RecommendationConference.query(ancestor=job.key).iter(
+                projection=[RecommendationConference.topics]):
+            conf_topics.setdefault(row.key.id(), []).append(row.topics[0])
+        data = (sims, conf_topics)
+        _rankData.set(job.key.id(), data)
+    return data
+
+
+def _rankConferences(job):
+    """Store the recommendations of a batch of conferences."""
+    sims, conf_topics = _loadRankData(job)
+    rows, cursors = _fetchPage(
+        RecommendationConference.query(ancestor=job.key), job,
+        RANK_BATCH_SIZE)
+    _advance(job, cursors, len(rows))
+    ndb.put_multi([RecommendedConferences(id=row.key.id(), conferenceKeys=[
+        ndb.Key(urlsafe=other) for other in _similar(row, conf_topics, sims)])
+        for row in rows])
+    if not job.cursor:
+        job.stage = 'cleanup'
+        _rankData.delete(job.key.id())
+    return [], []
+
+
+def _deleteWorkingData(job):
+    """Delete a batch of the job's working data, and the job once they
+    are gone."""
+    keys = RecommendationConference.query(ancestor=job.key).fetch(
+        RECOMMEND_BATCH_SIZE, keys_only=True) or \
+        RecommendationTopic.query(ancestor=job.key).fetch(
+        RECOMMEND_BATCH_SIZE, keys_only=True)
+    if not keys:
+        job.status = 'DONE'
+        keys = [job.key]
+    return [], keys
+
+
+STAGES = {
+    'conferences': _scanConferences,
+    'profiles': _scanProfiles,
+    'rank': _rankConferences,
+    'cleanup': _deleteWorkingData,
+}
+
+
+def runRecommendations(job_id):
+    """Run one batch of a RecommendationJob, chaining the next batch.
+
+    A stage returns the working data to put and delete, which are saved
+    with the job's progress in one transaction; a batch already saved by
+    another run of the same task is not saved again. The cleanup stage
+    deletes the job itself last.
+    """
+    job = RecommendationJob.get_by_id(job_id)
+    if not job or job.status != 'RUNNING':
+        return job
+    stage, cursor = job.stage, job.cursor
+    to_put, to_delete = STAGES[stage](job)
+
+    @ndb.transactional()
+    def save():
+        current = job.key.get()
+        if not current or current.stage != stage or \
+                current.cursor != cursor:
+            return
+        if job.status == 'RUNNING':
+            to_put.append(job)
+            taskqueue.add(params={'job': job_id},
+                url='/tasks/recommendations', transactional=True)
+        ndb.put_multi(to_put)
+        ndb.delete_multi(to_delete)
+    save()
+    return job
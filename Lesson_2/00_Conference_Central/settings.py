@@ -14,3 +14,9 @@ created/forked from conference.py by wesc on 2014 may 24
 # Console or Cloud Console.
 WEB_CLIENT_ID = '635063894392-sj22i7ofsioa9r9lp24jrqijm1j9kbe2.apps.googleusercontent.com'
 
+# How utils.getUserId identifies users: 'email' keys them by their email,
+# 'oauth' by the Google account id of their token and 'custom' by an id
+# stored per normalized email. Run /tasks/backfill_profile_emails before
+# switching an app with existing profiles from 'email' to 'custom'.
+USER_ID_TYPE = 'custom'
+
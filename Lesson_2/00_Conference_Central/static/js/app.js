@@ -15,6 +15,18 @@ var app = angular.module('conferenceApp',
     ['conferenceControllers', 'ngRoute', 'ui.bootstrap']).
     config(['$routeProvider',
         function ($routeProvider) {
+            /**
+             * Delays a route until the Google API client has loaded, for controllers calling the API at once.
+             * The conference list does not wait; it paints from the data inlined in index.html first.
+             */
+            var waitForApi = {
+                api: function ($q, apiReady) {
+                    var deferred = $q.defer();
+                    apiReady(deferred.resolve);
+                    return deferred.promise;
+                }
+            };
+
             $routeProvider.
                 when('/conference', {
                     templateUrl: '/partials/show_conferences.html',
@@ -22,15 +34,18 @@ var app = angular.module('conferenceApp',
                 }).
                 when('/conference/create', {
                     templateUrl: '/partials/create_conferences.html',
-                    controller: 'CreateConferenceCtrl'
+                    controller: 'CreateConferenceCtrl',
+                    resolve: waitForApi
                 }).
                 when('/conference/detail/:websafeConferenceKey', {
                     templateUrl: '/partials/conference_detail.html',
-                    controller: 'ConferenceDetailCtrl'
+                    controller: 'ConferenceDetailCtrl',
+                    resolve: waitForApi
                 }).
                 when('/profile', {
                     templateUrl: '/partials/profile.html',
-                    controller: 'MyProfileCtrl'
+                    controller: 'MyProfileCtrl',
+                    resolve: waitForApi
                 }).
                 when('/', {
                     templateUrl: '/partials/home.html'
@@ -41,25 +56,128 @@ var app = angular.module('conferenceApp',
         }]);
 
 /**
- * @ngdoc filter
- * @name startFrom
+ * @ngdoc object
+ * @name bootstrapData
+ *
+ * @description
+ * The announcement and first page of conferences the server inlined in index.html, if any.
+ *
+ */
+app.value('bootstrapData', window.BOOTSTRAP_DATA || {});
+
+
+/**
+ * @ngdoc service
+ * @name apiReady
+ *
+ * @description
+ * Calls back, inside a digest, once the Google API client has loaded the conference and oauth2 APIs.
+ *
+ */
+app.factory('apiReady', function ($window, $timeout) {
+    return function (callback) {
+        $window.apiReady(function () {
+            $timeout(callback);
+        });
+    };
+});
+
+
+/**
+ * @ngdoc directive
+ * @name infiniteScroll
+ *
+ * @description
+ * A directive that evaluates its expression when the bottom of the element scrolls
+ * into view, e.g. to load the next page of a list.
+ *
+ */
+app.directive('infiniteScroll', function ($window) {
+    /**
+     * Distance in pixels from the bottom of the element at which the expression is evaluated.
+     *
+     * @type {number}
+     */
+    var SCROLL_DISTANCE = 200;
+
+    return {
+        link: function (scope, element, attrs) {
+            var win = angular.element($window);
+            var onScroll = function () {
+                var bottom = element[0].getBoundingClientRect().bottom;
+                if (bottom - $window.innerHeight < SCROLL_DISTANCE) {
+                    scope.$apply(attrs.infiniteScroll);
+                }
+            };
+            win.on('scroll', onScroll);
+            scope.$on('$destroy', function () {
+                win.off('scroll', onScroll);
+            });
+        }
+    };
+});
+
+
+/**
+ * @ngdoc service
+ * @name conferenceCache
  *
  * @description
- * A filter that extracts an array from the specific index.
+ * Client-side cache of conference query results keyed by tab and filters.
+ * Cached results are shown immediately and revalidated in the background
+ * (stale-while-revalidate), so switching tabs does not wait for the network.
  *
  */
-app.filter('startFrom', function () {
+app.factory('conferenceCache', function (bootstrapData) {
+    var entries = {};
+    var conferenceCache = {};
+
+    /**
+     * Returns the cache key of a query.
+     *
+     * @param {string} tab
+     * @param {Array} filters
+     * @returns {string}
+     */
+    conferenceCache.key = function (tab, filters) {
+        return tab + ':' + JSON.stringify(filters || []);
+    };
+
     /**
-     * Extracts an array from the specific index.
+     * Returns the cached {items, nextPageToken} of a query, or undefined.
      *
-     * @param {Array} data
-     * @param {Integer} start
-     * @returns {Array|*}
+     * @param {string} key
+     * @returns {Object|undefined}
      */
-    var filter = function (data, start) {
-        return data.slice(start);
+    conferenceCache.get = function (key) {
+        return entries[key];
+    };
+
+    /**
+     * Caches the conferences loaded so far for a query.
+     *
+     * @param {string} key
+     * @param {Array} items
+     * @param {string|null} nextPageToken
+     */
+    conferenceCache.put = function (key, items, nextPageToken) {
+        entries[key] = {items: items.slice(), nextPageToken: nextPageToken};
+    };
+
+    /**
+     * Drops all cached results, e.g. when the signed in user changes.
+     */
+    conferenceCache.clear = function () {
+        entries = {};
+    };
+
+    // Start from the first page of all conferences the server inlined in index.html.
+    if (bootstrapData.conferences) {
+        conferenceCache.put(conferenceCache.key('ALL', []), bootstrapData.conferences.items || [],
+            bootstrapData.conferences.nextPageToken || null);
     }
-    return filter;
+
+    return conferenceCache;
 });
 
 
@@ -249,7 +249,7 @@ conferenceApp.controllers.controller('CreateConferenceCtrl',
  * @description
  * A controller used for the Show conferences page.
  */
-conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $log, oauth2Provider, HTTP_ERRORS) {
+conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $log, oauth2Provider, conferenceCache, apiReady, HTTP_ERRORS) {
 
     /**
      * Holds the status if the query is being executed.
@@ -270,7 +270,11 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
         {enumValue: 'CITY', displayName: 'City'},
         {enumValue: 'TOPIC', displayName: 'Topic'},
         {enumValue: 'MONTH', displayName: 'Start month'},
-        {enumValue: 'MAX_ATTENDEES', displayName: 'Max Attendees'}
+        {enumValue: 'MAX_ATTENDEES', displayName: 'Max Attendees'},
+        {enumValue: 'START_DATE', displayName: 'Start date (YYYY-MM-DD)'},
+        {enumValue: 'END_DATE', displayName: 'End date (YYYY-MM-DD)'},
+        {enumValue: 'YEAR_MONTH', displayName: 'Year and month (YYYY-MM)'},
+        {enumValue: 'ISO_WEEK', displayName: 'ISO week (YYYY-Www)'}
     ]
 
     /**
@@ -340,44 +344,29 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
     };
 
     /**
-     * Namespace for the pagination.
-     * @type {{}|*}
+     * Number of conferences fetched per page.
+     * @type {number}
      */
-    $scope.pagination = $scope.pagination || {};
-    $scope.pagination.currentPage = 0;
-    $scope.pagination.pageSize = 20;
+    $scope.pageSize = 20;
+
     /**
-     * Returns the number of the pages in the pagination.
-     *
-     * @returns {number}
+     * Token of the next page of the current query, or null if there are no more pages.
+     * @type {string|null}
      */
-    $scope.pagination.numberOfPages = function () {
-        return Math.ceil($scope.conferences.length / $scope.pagination.pageSize);
-    };
+    $scope.nextPageToken = null;
 
     /**
-     * Returns an array including the numbers from 1 to the number of the pages.
-     *
-     * @returns {Array}
+     * The query currently displayed; responses to older queries are ignored.
+     * @type {{key: string, fetchPage: Function, failureMessage: string}|null}
      */
-    $scope.pagination.pageArray = function () {
-        var pages = [];
-        var numberOfPages = $scope.pagination.numberOfPages();
-        for (var i = 0; i < numberOfPages; i++) {
-            pages.push(i);
-        }
-        return pages;
-    };
+    var currentQuery = null;
 
     /**
-     * Checks if the target element that invokes the click event has the "disabled" class.
-     *
-     * @param event the click event
-     * @returns {boolean} if the target element that has been clicked has the "disabled" class.
+     * The next page of the current query, fetched before the user scrolls to it.
+     * Holds the page token, and the response once it has arrived.
+     * @type {{token: string, resp: Object, wanted: boolean}|null}
      */
-    $scope.pagination.isDisabled = function (event) {
-        return angular.element(event.target).hasClass('disabled');
-    }
+    var prefetched = null;
 
     /**
      * Adds a filter and set the default value.
@@ -413,7 +402,6 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
      *
      */
     $scope.queryConferences = function () {
-        $scope.submitted = false;
         if ($scope.selectedTab == 'ALL') {
             $scope.queryConferencesAll();
         } else if ($scope.selectedTab == 'YOU_HAVE_CREATED') {
@@ -424,7 +412,140 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
     };
 
     /**
-     * Invokes the conference.queryConferences API.
+     * Shows the message of a failed request, and the login modal if the user needs to sign in.
+     *
+     * @param {string} failureMessage
+     * @param resp the response of the request
+     */
+    var showError = function (failureMessage, resp) {
+        var errorMessage = resp.error.message || '';
+        $scope.messages = failureMessage + errorMessage;
+        $scope.alertStatus = 'warning';
+        $log.error($scope.messages);
+
+        if (resp.code && resp.code == HTTP_ERRORS.UNAUTHORIZED) {
+            oauth2Provider.showLoginModal();
+        }
+    };
+
+    /**
+     * Shows the cached conferences of a query at once, then fetches its first page and
+     * replaces the conferences shown if they have changed (stale-while-revalidate).
+     *
+     * @param {string} key the conferenceCache key of the query
+     * @param {Function} fetchPage function (pageToken, callback) that requests one page
+     * @param {string} successMessage
+     * @param {string} failureMessage
+     */
+    var runQuery = function (key, fetchPage, successMessage, failureMessage) {
+        var query = {
+            key: key,
+            fetchPage: function (pageToken, callback) {
+                apiReady(function () {
+                    fetchPage(pageToken, callback);
+                });
+            },
+            failureMessage: failureMessage
+        };
+        var cached = conferenceCache.get(key);
+        currentQuery = query;
+        prefetched = null;
+        $scope.conferences = cached ? cached.items.slice() : [];
+        $scope.nextPageToken = cached ? cached.nextPageToken : null;
+        $scope.submitted = !!cached;
+        $scope.loading = !cached;
+
+        query.fetchPage(null, function (resp) {
+            $scope.$apply(function () {
+                if (query !== currentQuery) {
+                    return;
+                }
+                $scope.loading = false;
+                $scope.submitted = true;
+                if (resp.error) {
+                    // The request has failed.
+                    showError(failureMessage, resp);
+                    return;
+                }
+                // The request has succeeded.
+                $scope.messages = successMessage;
+                $scope.alertStatus = 'success';
+                $log.info($scope.messages);
+
+                // Keep the pages already shown unless the first page has changed.
+                var items = resp.items || [];
+                var unchanged = angular.equals(items, $scope.conferences.slice(0, items.length)) &&
+                    (resp.nextPageToken || items.length == $scope.conferences.length);
+                if (!unchanged) {
+                    $scope.conferences = items;
+                    $scope.nextPageToken = resp.nextPageToken || null;
+                    prefetched = null;
+                }
+                conferenceCache.put(key, $scope.conferences, $scope.nextPageToken);
+                prefetchNextPage();
+            });
+        });
+    };
+
+    /**
+     * Starts fetching the next page of the current query, unless it is being fetched already.
+     */
+    var prefetchNextPage = function () {
+        var query = currentQuery;
+        var token = $scope.nextPageToken;
+        if (!token || (prefetched && prefetched.token == token)) {
+            return;
+        }
+        var page = prefetched = {token: token};
+        query.fetchPage(token, function (resp) {
+            $scope.$apply(function () {
+                if (query !== currentQuery || page !== prefetched) {
+                    return;
+                }
+                page.resp = resp;
+                if (page.wanted) {
+                    showPrefetchedPage();
+                }
+            });
+        });
+    };
+
+    /**
+     * Appends the prefetched page to the conferences shown and prefetches the one after it.
+     */
+    var showPrefetchedPage = function () {
+        var resp = prefetched.resp;
+        prefetched = null;
+        $scope.loading = false;
+        if (resp.error) {
+            // The request has failed.
+            showError(currentQuery.failureMessage, resp);
+            return;
+        }
+        $scope.conferences = $scope.conferences.concat(resp.items || []);
+        $scope.nextPageToken = resp.nextPageToken || null;
+        conferenceCache.put(currentQuery.key, $scope.conferences, $scope.nextPageToken);
+        prefetchNextPage();
+    };
+
+    /**
+     * Shows the next page of the current query; called when the user scrolls to the end of the list.
+     */
+    $scope.loadMore = function () {
+        if (!$scope.nextPageToken) {
+            return;
+        }
+        prefetchNextPage();
+        if (prefetched.resp) {
+            showPrefetchedPage();
+        } else {
+            prefetched.wanted = true;
+            $scope.loading = true;
+        }
+    };
+
+    /**
+     * Invokes the conference.queryConferences API, one page at a time.
      */
     $scope.queryConferencesAll = function () {
         var sendFilters = {
@@ -440,102 +561,32 @@ conferenceApp.controllers.controller('ShowConferenceCtrl', function ($scope, $lo
                 });
             }
         }
-        $scope.loading = true;
-        gapi.client.conference.queryConferences(sendFilters).
-            execute(function (resp) {
-                $scope.$apply(function () {
-                    $scope.loading = false;
-                    if (resp.error) {
-                        // The request has failed.
-                        var errorMessage = resp.error.message || '';
-                        $scope.messages = 'Failed to query conferences : ' + errorMessage;
-                        $scope.alertStatus = 'warning';
-                        $log.error($scope.messages + ' filters : ' + JSON.stringify(sendFilters));
-                    } else {
-                        // The request has succeeded.
-                        $scope.submitted = false;
-                        $scope.messages = 'Query succeeded : ' + JSON.stringify(sendFilters);
-                        $scope.alertStatus = 'success';
-                        $log.info($scope.messages);
-
-                        $scope.conferences = [];
-                        angular.forEach(resp.items, function (conference) {
-                            $scope.conferences.push(conference);
-                        });
-                    }
-                    $scope.submitted = true;
-                });
-            });
-    }
+        runQuery(conferenceCache.key('ALL', sendFilters.filters), function (pageToken, callback) {
+            var params = angular.extend({pageSize: $scope.pageSize}, sendFilters);
+            if (pageToken) {
+                params.pageToken = pageToken;
+            }
+            gapi.client.conference.queryConferences(params).execute(callback);
+        }, 'Query succeeded : ' + JSON.stringify(sendFilters), 'Failed to query conferences : ');
+    };
 
     /**
      * Invokes the conference.getConferencesCreated method.
      */
     $scope.getConferencesCreated = function () {
-        $scope.loading = true;
-        gapi.client.conference.getConferencesCreated().
-            execute(function (resp) {
-                $scope.$apply(function () {
-                    $scope.loading = false;
-                    if (resp.error) {
-                        // The request has failed.
-                        var errorMessage = resp.error.message || '';
-                        $scope.messages = 'Failed to query the conferences created : ' + errorMessage;
-                        $scope.alertStatus = 'warning';
-                        $log.error($scope.messages);
-
-                        if (resp.code && resp.code == HTTP_ERRORS.UNAUTHORIZED) {
-                            oauth2Provider.showLoginModal();
-                            return;
-                        }
-                    } else {
-                        // The request has succeeded.
-                        $scope.submitted = false;
-                        $scope.messages = 'Query succeeded : Conferences you have created';
-                        $scope.alertStatus = 'success';
-                        $log.info($scope.messages);
-
-                        $scope.conferences = [];
-                        angular.forEach(resp.items, function (conference) {
-                            $scope.conferences.push(conference);
-                        });
-                    }
-                    $scope.submitted = true;
-                });
-            });
+        runQuery(conferenceCache.key('YOU_HAVE_CREATED'), function (pageToken, callback) {
+            gapi.client.conference.getConferencesCreated().execute(callback);
+        }, 'Query succeeded : Conferences you have created', 'Failed to query the conferences created : ');
     };
 
     /**
-     * Retrieves the conferences to attend by calling the conference.getProfile method and
-     * invokes the conference.getConference method n times where n == the number of the conferences to attend.
+     * Invokes the conference.getConferencesToAttend method.
      */
     $scope.getConferencesAttend = function () {
-        $scope.loading = true;
-        gapi.client.conference.getConferencesToAttend().
-            execute(function (resp) {
-                $scope.$apply(function () {
-                    if (resp.error) {
-                        // The request has failed.
-                        var errorMessage = resp.error.message || '';
-                        $scope.messages = 'Failed to query the conferences to attend : ' + errorMessage;
-                        $scope.alertStatus = 'warning';
-                        $log.error($scope.messages);
-
-                        if (resp.code && resp.code == HTTP_ERRORS.UNAUTHORIZED) {
-                            oauth2Provider.showLoginModal();
-                            return;
-                        }
-                    } else {
-                        // The request has succeeded.
-                        $scope.conferences = resp.result.items;
-                        $scope.loading = false;
-                        $scope.messages = 'Query succeeded : Conferences you will attend (or you have attended)';
-                        $scope.alertStatus = 'success';
-                        $log.info($scope.messages);
-                    }
-                    $scope.submitted = true;
-                });
-            });
+        runQuery(conferenceCache.key('YOU_WILL_ATTEND'), function (pageToken, callback) {
+            gapi.client.conference.getConferencesToAttend().execute(callback);
+        }, 'Query succeeded : Conferences you will attend (or you have attended)',
+            'Failed to query the conferences to attend : ');
     };
 });
 
@@ -691,7 +742,7 @@ conferenceApp.controllers.controller('ConferenceDetailCtrl', function ($scope, $
  * such as user authentications.
  *
  */
-conferenceApp.controllers.controller('RootCtrl', function ($scope, $location, oauth2Provider) {
+conferenceApp.controllers.controller('RootCtrl', function ($scope, $location, oauth2Provider, conferenceCache, apiReady, bootstrapData) {
 
     /**
      * Returns if the viewLocation is the currently viewed page.
@@ -735,26 +786,45 @@ conferenceApp.controllers.controller('RootCtrl', function ($scope, $location, oa
      *  after the rendering)
      */
     $scope.initSignInButton = function () {
-        gapi.signin.render('signInButton', {
-            'callback': function () {
-                jQuery('#signInButton button').attr('disabled', 'true').css('cursor', 'default');
-                if (gapi.auth.getToken() && gapi.auth.getToken().access_token) {
-                    $scope.$apply(function () {
-                        oauth2Provider.signedIn = true;
-                    });
-                }
-            },
-            'clientid': oauth2Provider.CLIENT_ID,
-            'cookiepolicy': 'single_host_origin',
-            'scope': oauth2Provider.SCOPES
+        apiReady(function () {
+            gapi.signin.render('signInButton', {
+                'callback': function () {
+                    jQuery('#signInButton button').attr('disabled', 'true').css('cursor', 'default');
+                    if (gapi.auth.getToken() && gapi.auth.getToken().access_token) {
+                        $scope.$apply(function () {
+                            oauth2Provider.signedIn = true;
+                        });
+                    }
+                },
+                'clientid': oauth2Provider.CLIENT_ID,
+                'cookiepolicy': 'single_host_origin',
+                'scope': oauth2Provider.SCOPES
+            });
         });
     };
 
+    /**
+     * The current announcement; shown from the data inlined in index.html, then refreshed from the API.
+     * @type {string}
+     */
+    $scope.announcement = bootstrapData.announcement || '';
+
+    apiReady(function () {
+        gapi.client.conference.getAnnouncement().execute(function (resp) {
+            $scope.$apply(function () {
+                if (!resp.error) {
+                    $scope.announcement = resp.data || '';
+                }
+            });
+        });
+    });
+
     /**
      * Logs out the user.
      */
     $scope.signOut = function () {
         oauth2Provider.signOut();
+        conferenceCache.clear();
         $scope.alertStatus = 'success';
         $scope.rootMessages = 'Logged out';
     };
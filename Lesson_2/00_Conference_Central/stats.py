@@ -0,0 +1,155 @@
+#!/usr/bin/env python
+
+"""stats.py
+
+Udacity conference server-side Python App Engine aggregate conference
+statistics; counts of conferences, seats and registrations, overall and
+by city and month, kept in sharded counters updated with each write
+
+"""
+
+import random
+
+from google.appengine.api import memcache
+from google.appengine.ext import ndb
+
+from batch import BatchMapper
+from batch import mapper
+from models import Conference
+from models import ConferenceStatsShard
+
+# each write updates one random shard, spreading writes over this many
+# entity groups; the rebuild rewrites all of them in one transaction, so
+# keep it below the 25 entity groups of a cross-group transaction
+NUM_STATS_SHARDS = 20
+MEMCACHE_STATS_KEY = "CONFERENCE_STATS"
+# bounds how stale getConferenceStats may be; writes do not touch the
+# cached sums, so they do not contend on a single memcache key
+STATS_CACHE_TTL = 60
+STATS_BATCH_SIZE = 500
+
+CONFERENCES, SEATS, REGISTRATIONS = range(3)
+COLUMNS = ('conferences', 'seats', 'registrations')
+
+
+def _shardKeys():
+    return [ndb.Key(ConferenceStatsShard, i + 1)
+        for i in range(NUM_STATS_SHARDS)]
+
+
+def _buckets(conf):
+    """Return the stats buckets a conference is counted in."""
+    buckets = ['']
+    if conf.city:
+        buckets.append('city:' + conf.city)
+    if conf.month:
+        buckets.append('month:%d' % conf.month)
+    return buckets
+
+
+def _addCounts(counts, buckets, deltas):
+    for bucket in buckets:
+        row = counts.setdefault(bucket, [0, 0, 0])
+        for i, delta in enumerate(deltas):
+            row[i] += delta
+
+
+def _seatsTaken(conf):
+    """Return the seats of conf taken by registrations."""
+    seats = conf.maxAttendees or 0
+    return seats - (conf.seatsAvailable or 0) if seats > 0 else 0
+
+
+def _addToShard(conf_deltas):
+    """Add the deltas of each (conf, deltas) to the buckets of conf in
+    one random shard.
+
+    Call this inside the transaction that writes the change, so the
+    counts move with it.
+    """
+    key = random.choice(_shardKeys())
+    shard = key.get() or ConferenceStatsShard(key=key)
+    counts = shard.counts or {}
+    for conf, deltas in conf_deltas:
+        _addCounts(counts, _buckets(conf), deltas)
+    shard.counts = counts
+    shard.put()
+
+
+def countConference(conf):
+    """Count a new conference and its seats."""
+    _addToShard([(conf, (1, conf.maxAttendees or 0, 0))])
+
+
+def countImportedConferences(confs):
+    """Count imported conferences with their seats and the registrations
+    they were exported with."""
+    _addToShard([(conf, (1, conf.maxAttendees or 0, _seatsTaken(conf)))
+        for conf in confs])
+
+
+def countRegistration(conf, delta=1):
+    """Count a registration for conf, or with delta=-1 its cancellation."""
+    _addToShard([(conf, (0, 0, delta))])
+
+
+def getConferenceStats():
+    """Return {bucket: [conferences, seats, registrations]} summed over
+    the shards, cached in memcache for STATS_CACHE_TTL secs."""
+    counts = memcache.get(MEMCACHE_STATS_KEY)
+    if counts is None:
+        counts = {}
+        for shard in ndb.get_multi(_shardKeys()):
+            if shard and shard.counts:
+                for bucket, row in shard.counts.items():
+                    _addCounts(counts, [bucket], row)
+        memcache.set(MEMCACHE_STATS_KEY, counts, time=STATS_CACHE_TTL)
+    return counts
+
+
+@ndb.transactional(xg=True)
+def _replaceShards(counts):
+    shards = [ConferenceStatsShard(key=key, counts={})
+        for key in _shardKeys()]
+    shards[0].counts = counts
+    ndb.put_multi(shards)
+
+
+@mapper
+class RebuildConferenceStats(BatchMapper):
+    """Recount every conference and replace the shards with the counts.
+
+    This is a repair job, started by hand: writes made while it runs may
+    be counted twice or not at all, so run it when the app is quiet.
+    Conference imports count their conferences as they go and do not
+    need it. The partial counts are kept in the job's
+    totals, as '<column>@<bucket>'; registrations are counted as the
+    seats taken of each conference, which registration keeps in step.
+    """
+    name = 'rebuild_conference_stats'
+    batch_size = STATS_BATCH_SIZE
+
+    def query(self):
+        return Conference.query()
+
+    def process(self, confs, totals):
+        for conf in confs:
+            deltas = (1, conf.maxAttendees or 0, _seatsTaken(conf))
+            for bucket in _buckets(conf):
+                for column, delta in zip(COLUMNS, deltas):
+                    name = '%s@%s' % (column, bucket)
+                    totals[name] = totals.get(name, 0) + delta
+        return [], []
+
+    def finish(self, job, totals):
+        counts, batch_totals = {}, {}
+        for name, value in totals.items():
+            if '@' in name:
+                column, bucket = name.split('@', 1)
+                row = counts.setdefault(bucket, [0, 0, 0])
+                row[COLUMNS.index(column)] = value
+            else:
+                batch_totals[name] = value
+        _replaceShards(counts)
+        memcache.delete(MEMCACHE_STATS_KEY)
+        super(RebuildConferenceStats, self).finish(job, batch_totals)
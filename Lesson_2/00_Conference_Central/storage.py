@@ -0,0 +1,96 @@
+#!/usr/bin/env python
+
+"""storage.py
+
+Udacity conference server-side Python App Engine blob storage for bulk
+export and import files: Google Cloud Storage, or a local directory when
+the cloudstorage client library is not installed
+
+"""
+
+import os
+
+from google.appengine.api import app_identity
+
+# where LocalBlobStore keeps files by default
+LOCAL_BLOB_ROOT = os.path.join(os.path.dirname(__file__), '.blobs')
+
+
+class LocalBlobStore(object):
+    """LocalBlobStore -- blob store backed by a local directory
+
+    Only usable outside the development server, whose sandbox does not
+    allow writing files; scripts and tests may also pass one explicitly.
+    """
+
+    def __init__(self, root=LOCAL_BLOB_ROOT):
+        self.root = root
+
+    def _path(self, name):
+        return os.path.join(self.root, *name.split('/'))
+
+    def write(self, name, data):
+        """Create or replace blob name with data."""
+        path = self._path(name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        with open(path, 'wb') as f:
+            f.write(data)
+
+    def read(self, name):
+        """Return the contents of blob name."""
+        with open(self._path(name), 'rb') as f:
+            return f.read()
+
+    def exists(self, name):
+        """Return True if blob name exists."""
+        return os.path.isfile(self._path(name))
+
+
+class GcsBlobStore(object):
+    """GcsBlobStore -- blob store backed by a Cloud Storage bucket"""
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+
+    def _path(self, name):
+        return '/%s/%s' % (self.bucket, name)
+
+    def write(self, name, data):
+        """Create or replace blob name with data."""
+        import cloudstorage
+        with cloudstorage.open(self._path(name), 'w',
+                content_type='application/x-ndjson') as f:
+            f.write(data)
+
+    def read(self, name):
+        """Return the contents of blob name."""
+        import cloudstorage
+        with cloudstorage.open(self._path(name)) as f:
+            return f.read()
+
+    def exists(self, name):
+        """Return True if blob name exists."""
+        import cloudstorage
+        try:
+            cloudstorage.stat(self._path(name))
+        except cloudstorage.NotFoundError:
+            return False
+        return True
+
+
+def getBlobStore():
+    """Return the blob store for the current environment.
+
+    Production uses the app's default Cloud Storage bucket through the
+    cloudstorage client library (GoogleAppEngineCloudStorageClient),
+    installed into lib/ as described in README.txt; the development
+    server uses it too, with its own Cloud Storage stub, when lib/ holds
+    it. Without the library the local directory is used, which works in
+    scripts and tests but not under the development server's sandbox.
+    """
+    try:
+        import cloudstorage
+    except ImportError:
+        return LocalBlobStore()
+    return GcsBlobStore(app_identity.get_default_gcs_bucket_name())
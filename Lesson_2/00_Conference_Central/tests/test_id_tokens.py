@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+
+"""test_id_tokens.py
+
+Udacity conference server-side Python App Engine ID token verification
+tests; signs tokens with a locally generated RSA key, so they run
+offline on the SDK's service stubs
+
+usage: GAE_SDK=PATH python tests/test_id_tokens.py
+
+"""
+
+import base64
+import json
+import os
+import sys
+import time
+import unittest
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.getenv('GAE_SDK', '/usr/local/google_appengine'))
+import dev_appserver
+dev_appserver.fix_sys_path()
+sys.path.insert(0, APP_DIR)
+
+from Crypto.Hash import SHA256
+from Crypto.PublicKey import RSA
+from Crypto.Signature import PKCS1_v1_5
+from google.appengine.api import urlfetch
+from google.appengine.ext import testbed
+
+import utils
+
+KID = 'test-key'
+
+
+def _b64encode(data):
+    """Encode data as unpadded base64url."""
+    return base64.urlsafe_b64encode(data).rstrip('=')
+
+
+def _b64encodeLong(value):
+    """Encode a big-endian integer as a JWK member."""
+    digits = '%x' % value
+    return _b64encode(('0' * (len(digits) % 2) + digits).decode('hex'))
+
+
+class _Response(object):
+    def __init__(self, status_code, content, headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+
+class IdTokenTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.key = RSA.generate(2048)
+        cls.jwk = {'kid': KID, 'n': _b64encodeLong(cls.key.n),
+            'e': _b64encodeLong(cls.key.e)}
+
+    def setUp(self):
+        self.testbed = testbed.Testbed()
+        self.testbed.activate()
+        self.testbed.init_memcache_stub()
+        self.testbed.init_urlfetch_stub()
+        utils._certs_cache.clear()
+        utils._token_cache.clear()
+        self.fetches = []
+        self.fetch = utils.urlfetch.fetch
+        utils.urlfetch.fetch = self._fetchCerts
+        self.now = time.time()
+
+    def tearDown(self):
+        utils.urlfetch.fetch = self.fetch
+        self.testbed.deactivate()
+
+    def _fetchCerts(self, url):
+        self.fetches.append(url)
+        return _Response(200, json.dumps({'keys': [self.jwk]}),
+            {'Cache-Control': 'public, max-age=600'})
+
+    def _claims(self, **claims):
+        defaults = {'iss': 'accounts.google.com', 'aud': utils.WEB_CLIENT_ID,
+            'sub': '1234567890', 'iat': int(self.now),
+            'exp': int(self.now) + 3600}
+        defaults.update(claims)
+        return defaults
+
+    def _token(self, claims, key=None, kid=KID):
+        header = _b64encode(json.dumps({'alg': 'RS256', 'kid': kid}))
+        body = _b64encode(json.dumps(claims))
+        signature = PKCS1_v1_5.new(key or self.key).sign(
+            SHA256.new('%s.%s' % (header, body)))
+        return '%s.%s.%s' % (header, body, _b64encode(signature))
+
+    def assertRejected(self, token, message):
+        with self.assertRaises(utils.TokenError) as raised:
+            utils.verifyIdToken(token, now=self.now)
+        self.assertIn(message, str(raised.exception))
+
+    def testValidToken(self):
+        claims = utils.verifyIdToken(self._token(self._claims()),
+            now=self.now)
+        self.assertEqual(claims['sub'], '1234567890')
+        # the key set is fetched once, then served from the caches
+        utils.verifyIdToken(self._token(self._claims()), now=self.now)
+        self.assertEqual(self.fetches, [utils.GOOGLE_CERTS_URL])
+
+    def testBadSignature(self):
+        self.assertRejected(self._token(self._claims(),
+            key=RSA.generate(2048)), 'Invalid signature')
+        header, body, signature = self._token(self._claims()).split('.')
+        other = _b64encode(json.dumps(self._claims(sub='someone else')))
+        self.assertRejected('.'.join((header, other, signature)),
+            'Invalid signature')
+
+    def testWrongAudience(self):
+        self.assertRejected(self._token(self._claims(aud='other-client')),
+            'Invalid audience')
+
+    def testWrongIssuer(self):
+        self.assertRejected(self._token(self._claims(iss='example.com')),
+            'Invalid issuer')
+
+    def testExpired(self):
+        expired = int(self.now) - utils.CLOCK_SKEW_SECS - 1
+        self.assertRejected(self._token(self._claims(exp=expired)),
+            'Token expired')
+        # within the allowed clock skew
+        utils.verifyIdToken(self._token(self._claims(exp=int(self.now) - 1)),
+            now=self.now)
+
+    def testMalformed(self):
+        token = self._token(self._claims())
+        for bad in ('', 'not a token', token.rsplit('.', 1)[0],
+                token + '.extra', '!!!.%s' % token.split('.', 1)[1],
+                '%s.%s.sig' % (_b64encode('[]'), _b64encode('{}'))):
+            self.assertRejected(bad, 'Malformed token')
+        self.assertRejected(self._token(self._claims(exp='soon')),
+            'Malformed token times')
+        self.assertRejected(self._token(self._claims(), kid=['k']),
+            'Unknown signing key')
+
+    def testUnknownKeyRefetchesCerts(self):
+        self.assertRejected(self._token(self._claims(), kid='rotated'),
+            'Unknown signing key')
+        # the cached key set was refreshed once for the unknown kid
+        self.assertEqual(len(self.fetches), 2)
+
+    def testCertsFetchFailure(self):
+        def unreachable(url):
+            raise urlfetch.DownloadError('unreachable')
+        utils.urlfetch.fetch = unreachable
+        self.assertRejected(self._token(self._claims()),
+            'Could not fetch signing keys')
+
+        utils.urlfetch.fetch = lambda url: _Response(500, 'error')
+        self.assertRejected(self._token(self._claims()),
+            'Could not fetch signing keys')
+
+        utils.urlfetch.fetch = lambda url: _Response(200, '{"keys": 1}')
+        self.assertRejected(self._token(self._claims()),
+            'Malformed signing key set')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+#!/usr/bin/env python
+
+"""timeline.py
+
+Udacity conference server-side Python App Engine per-conference session
+timeline, cached in memcache
+
+"""
+
+import bisect
+
+from google.appengine.api import memcache
+
+from models import Session
+
+MEMCACHE_TIMELINE_PREFIX = "TIMELINE_"
+# placeholder held in memcache while a timeline is rebuilt
+TIMELINE_REBUILDING = "REBUILDING"
+REBUILD_LEASE_TTL = 30
+# bounds how long a timeline missing a session could survive
+TIMELINE_CACHE_TTL = 3600
+MINUTES_PER_DAY = 24 * 60
+
+
+def timelineMinute(day, hhmm):
+    """Return the absolute minute of a date and a 24h HHMM time (e.g. 1430)."""
+    return day.toordinal() * MINUTES_PER_DAY + (hhmm // 100) * 60 + hhmm % 100
+
+
+class SessionTimeline(object):
+    """SessionTimeline -- a conference's sessions as intervals sorted by start
+
+    Intervals are (start, end, websafeKey) in absolute minutes. Queries bisect
+    on start; because no interval is longer than maxDuration, the sessions
+    overlapping a point or window lie in a contiguous slice of the list, so
+    each query costs O(log n + k) for k candidates.
+    """
+
+    def __init__(self, intervals=()):
+        self.intervals = sorted(intervals)
+        self.starts = [i[0] for i in self.intervals]
+        self.maxDuration = max([end - start for start, end, key
+            in self.intervals] or [0])
+
+    @classmethod
+    def fromSessions(cls, sessions):
+        """Build a timeline from Session entities, skipping undated ones."""
+        intervals = []
+        for session in sessions:
+            if not session.date:
+                continue
+            start = timelineMinute(session.date, session.start_time or 0)
+            intervals.append(
+                (start, start + (session.duration or 0), session.key.urlsafe()))
+        return cls(intervals)
+
+    def add(self, start, end, key):
+        """Insert one interval, keeping the timeline sorted."""
+        index = bisect.bisect_right(self.intervals, (start, end, key))
+        self.intervals.insert(index, (start, end, key))
+        self.starts.insert(index, start)
+        self.maxDuration = max(self.maxDuration, end - start)
+
+    def runningAt(self, minute):
+        """Return keys of sessions with start <= minute < end."""
+        return self.inWindow(minute, minute + 1)
+
+    def inWindow(self, first, last):
+        """Return keys of sessions overlapping the window [first, last)."""
+        lo = bisect.bisect_left(self.starts, first - self.maxDuration)
+        hi = bisect.bisect_left(self.starts, last)
+        return [key for start, end, key in self.intervals[lo:hi]
+            if end > first or (start == end and start >= first)]
+
+    def upcoming(self, minute, count):
+        """Return keys of the first count sessions starting at or after minute."""
+        lo = bisect.bisect_left(self.starts, minute)
+        return [key for start, end, key in self.intervals[lo:lo + count]]
+
+    def __getstate__(self):
+        # only the intervals are stored; the rest is derived on load
+        return self.intervals
+
+    def __setstate__(self, intervals):
+        self.__init__(intervals)
+
+
+def getTimeline(conf_key):
+    """Return a conference's SessionTimeline, rebuilding it on a cache miss.
+
+    A rebuild first leaves a placeholder in memcache and stores its result
+    with compare-and-set; addSessionToTimeline deletes the placeholder, so
+    a rebuild whose query may have missed a new session is not cached.
+    """
+    cache_key = MEMCACHE_TIMELINE_PREFIX + conf_key.urlsafe()
+    client = memcache.Client()
+    timeline = client.gets(cache_key)
+    if isinstance(timeline, SessionTimeline):
+        return timeline
+    if timeline is None:
+        client.add(cache_key, TIMELINE_REBUILDING, time=REBUILD_LEASE_TTL)
+        timeline = client.gets(cache_key)
+    leased = timeline == TIMELINE_REBUILDING
+    timeline = SessionTimeline.fromSessions(
+        Session.query(ancestor=conf_key))
+    if leased:
+        client.cas(cache_key, timeline, time=TIMELINE_CACHE_TTL)
+    return timeline
+
+
+def addSessionToTimeline(session):
+    """Add a new Session to its conference's cached timeline, if cached.
+
+    Uses compare-and-set so concurrent session creations do not lose each
+    other's updates; on repeated contention, or while the timeline is
+    being rebuilt, the entry is dropped and the next read rebuilds it.
+    """
+    if not session.date:
+        return
+    start = timelineMinute(session.date, session.start_time or 0)
+    interval = (start, start + (session.duration or 0), session.key.urlsafe())
+    cache_key = MEMCACHE_TIMELINE_PREFIX + session.key.parent().urlsafe()
+    client = memcache.Client()
+    for i in range(3):
+        timeline = client.gets(cache_key)
+        if timeline is None:
+            return
+        if not isinstance(timeline, SessionTimeline):
+            break
+        timeline.add(*interval)
+        if client.cas(cache_key, timeline, time=TIMELINE_CACHE_TTL):
+            return
+    memcache.delete(cache_key)
@@ -1,45 +1,352 @@
+import base64
+import hashlib
 import json
+import logging
 import os
+import re
 import time
+import unicodedata
 import uuid
+from datetime import date
+from datetime import datetime
+from datetime import timedelta
 
+from google.appengine.api import memcache
 from google.appengine.api import urlfetch
+from google.appengine.ext import ndb
 from models import Profile
+from models import UserIdentity
 
-def getUserId(user, id_type="email"):
+from cache import LRUCache
+from settings import USER_ID_TYPE
+from settings import WEB_CLIENT_ID
+
+# Google's ID token signing keys, published as a JSON Web Key Set
+GOOGLE_CERTS_URL = 'https://www.googleapis.com/oauth2/v3/certs'
+TOKENINFO_URL = 'https://www.googleapis.com/oauth2/v1/tokeninfo?%s=%s'
+ID_TOKEN_ISSUERS = ('accounts.google.com', 'https://accounts.google.com')
+ID_TOKEN_AUDIENCES = (WEB_CLIENT_ID,)
+CLOCK_SKEW_SECS = 300
+
+MEMCACHE_CERTS_KEY = "GOOGLE_CERTS"
+MEMCACHE_TOKEN_PREFIX = "TOKEN_USER_ID_"
+MEMCACHE_IDENTITY_PREFIX = "IDENTITY_"
+DEFAULT_CERTS_TTL = 3600
+DEFAULT_TOKEN_TTL = 300
+
+# token hash -> user_id, and the parsed key set, shared by all requests
+# served by this instance
+_token_cache = LRUCache(max_size=2000, ttl=DEFAULT_TOKEN_TTL)
+_certs_cache = LRUCache(max_size=1, ttl=DEFAULT_CERTS_TTL)
+# normalized email -> user_id; the mapping never changes once created
+_identity_cache = LRUCache(max_size=5000, ttl=3600)
+
+
+class TokenError(Exception):
+    """TokenError -- ID token could not be verified locally"""
+    pass
+
+
+def _b64decode(data):
+    """Decode unpadded base64url data."""
+    if isinstance(data, unicode):
+        data = data.encode('ascii')
+    return base64.urlsafe_b64decode(data + '=' * (-len(data) % 4))
+
+
+def _b64decodeLong(data):
+    """Decode a base64url big-endian integer (JWK 'n' and 'e' members)."""
+    return long(_b64decode(data).encode('hex'), 16)
+
+
+def _maxAge(headers, default):
+    """Return max-age from a Cache-Control header, or default."""
+    for name, value in headers.items():
+        if name.lower() == 'cache-control':
+            match = re.search(r'max-age=(\d+)', value)
+            if match:
+                return int(match.group(1))
+    return default
+
+
+def _fetchCerts():
+    """Fetch Google's signing key set; returns (keys dict, ttl)."""
+    try:
+        resp = urlfetch.fetch(GOOGLE_CERTS_URL)
+    except urlfetch.Error as e:
+        raise TokenError('Could not fetch signing keys: %s' % e)
+    if resp.status_code != 200:
+        raise TokenError('Could not fetch signing keys: %s' % resp.status_code)
+    try:
+        keys = dict((k['kid'], k) for k in json.loads(resp.content)['keys'])
+    except (ValueError, TypeError, KeyError):
+        raise TokenError('Malformed signing key set')
+    return keys, _maxAge(resp.headers, DEFAULT_CERTS_TTL)
+
+
+def getCerts(refresh=False):
+    """Return cached signing keys by kid, fetching them when stale."""
+    if not refresh:
+        keys = _certs_cache.get(MEMCACHE_CERTS_KEY)
+        if keys:
+            return keys
+        keys = memcache.get(MEMCACHE_CERTS_KEY)
+        if keys:
+            _certs_cache.set(MEMCACHE_CERTS_KEY, keys)
+            return keys
+    keys, ttl = _fetchCerts()
+    memcache.set(MEMCACHE_CERTS_KEY, keys, time=ttl)
+    _certs_cache.set(MEMCACHE_CERTS_KEY, keys, ttl=ttl)
+    return keys
+
+
+def verifyIdToken(token, keys=None, audiences=ID_TOKEN_AUDIENCES, now=None):
+    """Verify an RS256 ID token's signature and claims; return the claims.
+
+    keys maps kid to a JWK dict; if omitted the cached Google key set is
+    used and refreshed once when the token's kid is unknown (key rotation).
+    """
+    # imported lazily so the module stays importable without pycrypto
+    from Crypto.Hash import SHA256
+    from Crypto.PublicKey import RSA
+    from Crypto.Signature import PKCS1_v1_5
+
+    try:
+        header_b64, claims_b64, signature_b64 = token.split('.')
+        header = json.loads(_b64decode(header_b64))
+        claims = json.loads(_b64decode(claims_b64))
+        signature = _b64decode(signature_b64)
+    except (ValueError, TypeError):
+        raise TokenError('Malformed token')
+    if not isinstance(header, dict) or not isinstance(claims, dict):
+        raise TokenError('Malformed token')
+
+    if header.get('alg') != 'RS256':
+        raise TokenError('Unsupported algorithm: %s' % header.get('alg'))
+
+    kid = header.get('kid')
+    if not isinstance(kid, basestring):
+        raise TokenError('Unknown signing key: %s' % kid)
+    if keys is None:
+        keys = getCerts()
+        if kid not in keys:
+            keys = getCerts(refresh=True)
+    if kid not in keys:
+        raise TokenError('Unknown signing key: %s' % kid)
+
+    jwk = keys[kid]
+    public_key = RSA.construct(
+        (_b64decodeLong(jwk['n']), _b64decodeLong(jwk['e'])))
+    digest = SHA256.new('%s.%s' % (header_b64, claims_b64))
+    try:
+        # pycrypto raises ValueError for a signature larger than the modulus
+        valid = PKCS1_v1_5.new(public_key).verify(digest, signature)
+    except ValueError:
+        valid = False
+    if not valid:
+        raise TokenError('Invalid signature')
+
+    if now is None:
+        now = time.time()
+    if claims.get('iss') not in ID_TOKEN_ISSUERS:
+        raise TokenError('Invalid issuer: %s' % claims.get('iss'))
+    if claims.get('aud') not in audiences:
+        raise TokenError('Invalid audience: %s' % claims.get('aud'))
+    try:
+        issued, expires = int(claims.get('iat', 0)), int(claims.get('exp', 0))
+    except (ValueError, TypeError):
+        raise TokenError('Malformed token times')
+    if issued > now + CLOCK_SKEW_SECS:
+        raise TokenError('Token used too early')
+    if expires < now - CLOCK_SKEW_SECS:
+        raise TokenError('Token expired')
+    if not claims.get('sub'):
+        raise TokenError('Token has no subject')
+    return claims
+
+
+def _fetchTokenInfo(token, token_type):
+    """Resolve a token through the remote tokeninfo endpoint.
+
+    Returns (user_id, ttl); user_id is '' when the token was rejected.
+    """
+    url = TOKENINFO_URL % (token_type, token)
+    user = {}
+    wait = 1
+    for i in range(3):
+        resp = urlfetch.fetch(url)
+        if resp.status_code == 200:
+            user = json.loads(resp.content)
+            break
+        elif resp.status_code == 400 and 'invalid_token' in resp.content:
+            url = TOKENINFO_URL % ('access_token', token)
+        else:
+            time.sleep(wait)
+            wait = wait + i
+    return user.get('user_id', ''), int(user.get('expires_in', 0))
+
+
+def _getOAuthUserId():
+    """Return the user_id for the bearer token of the current request."""
+    auth = os.getenv('HTTP_AUTHORIZATION')
+    bearer, token = auth.split()
+    token_hash = hashlib.sha256(token).hexdigest()
+
+    user_id = _token_cache.get(token_hash)
+    if user_id:
+        return user_id
+    user_id = memcache.get(MEMCACHE_TOKEN_PREFIX + token_hash)
+    if user_id:
+        _token_cache.set(token_hash, user_id)
+        return user_id
+
+    ttl = 0
+    token_type = 'id_token'
+    if 'OAUTH_USER_ID' in os.environ:
+        token_type = 'access_token'
+    else:
+        try:
+            claims = verifyIdToken(token)
+            user_id = claims['sub']
+            ttl = int(claims['exp']) - int(time.time())
+        except TokenError as e:
+            logging.info('Local ID token verification failed: %s', e)
+
+    if not user_id:
+        user_id, ttl = _fetchTokenInfo(token, token_type)
+
+    if user_id and ttl > 0:
+        ttl = min(ttl, DEFAULT_TOKEN_TTL)
+        memcache.set(MEMCACHE_TOKEN_PREFIX + token_hash, user_id, time=ttl)
+        _token_cache.set(token_hash, user_id, ttl=ttl)
+    return user_id
+
+
+def parseDate(value):
+    """Parse a 'YYYY-MM-DD' string (time suffix ignored) into a date."""
+    if isinstance(value, date):
+        return value
+    return datetime.strptime(value[:10], "%Y-%m-%d").date()
+
+
+def yearMonth(d):
+    """Return the year-month bucket of a date, e.g. 201706."""
+    return d.year * 100 + d.month
+
+
+def isoWeek(d):
+    """Return the ISO year-week bucket of a date, e.g. 201723."""
+    year, week, weekday = d.isocalendar()
+    return year * 100 + week
+
+
+def parseYearMonth(value):
+    """Parse 'YYYY-MM' or 'YYYYMM' into a year-month bucket."""
+    value = str(value).replace('-', '')
+    bucket = int(value)
+    if not 1 <= bucket % 100 <= 12:
+        raise ValueError('Invalid month in %s' % value)
+    return bucket
+
+
+def parseIsoWeek(value):
+    """Parse 'YYYY-Www', 'YYYY-ww' or 'YYYYww' into an ISO week bucket."""
+    value = str(value).upper().replace('-', '').replace('W', '')
+    bucket = int(value)
+    if not 1 <= bucket % 100 <= 53:
+        raise ValueError('Invalid week in %s' % value)
+    return bucket
+
+
+def calendarBuckets(start_date):
+    """Return the derived month/yearMonth/isoWeek values of a start date."""
+    if not start_date:
+        return {'month': 0, 'yearMonth': None, 'isoWeek': None}
+    return {
+        'month': start_date.month,
+        'yearMonth': yearMonth(start_date),
+        'isoWeek': isoWeek(start_date),
+    }
+
+
+def monthsBetween(first, last):
+    """Return the year-month buckets overlapping [first, last]."""
+    buckets = []
+    year, month = first.year, first.month
+    while (year, month) <= (last.year, last.month):
+        buckets.append(year * 100 + month)
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+    return buckets
+
+
+def weeksBetween(first, last):
+    """Return the ISO week buckets overlapping [first, last]."""
+    buckets = []
+    day = first - timedelta(days=first.weekday())
+    while day <= last:
+        buckets.append(isoWeek(day))
+        day += timedelta(days=7)
+    return buckets
+
+
+def normalizeEmail(email):
+    """Return the canonical form of an email used to key UserIdentity."""
+    return email.strip().lower()
+
+
+def normalizeSpeakerName(name):
+    """Return the canonical form of a speaker name used to key Speaker.
+
+    Unicode compatibility forms are folded (NFKC), case is lowered and
+    runs of whitespace collapse to a single space.
+    """
+    if not isinstance(name, unicode):
+        name = name.decode('utf-8')
+    name = unicodedata.normalize('NFKC', name).lower()
+    return u' '.join(name.split())
+
+
+@ndb.non_transactional
+def _getCustomUserId(email):
+    """Return the user id for email, creating its UserIdentity if needed.
+
+    The caller may first resolve its user inside a transaction; the
+    lookup runs outside it, as its Profile query is not an ancestor query.
+    """
+    email = normalizeEmail(email)
+    user_id = _identity_cache.get(email)
+    if user_id:
+        return user_id
+    user_id = memcache.get(MEMCACHE_IDENTITY_PREFIX + email)
+    if not user_id:
+        identity = UserIdentity.get_by_id(email)
+        if not identity:
+            # first sighting of this email: reuse the id of a Profile
+            # created before identities existed, otherwise mint a new one
+            profile = Profile.query(Profile.normalizedEmail == email).get(
+                keys_only=True)
+            if profile:
+                candidate = profile.id()
+            else:
+                candidate = uuid.uuid1().get_hex()
+            # get_or_insert is transactional, so concurrent first requests
+            # agree on whichever id was stored first
+            identity = UserIdentity.get_or_insert(email, userId=candidate)
+        user_id = identity.userId
+        memcache.set(MEMCACHE_IDENTITY_PREFIX + email, user_id)
+    _identity_cache.set(email, user_id)
+    return user_id
+
+
+def getUserId(user, id_type=USER_ID_TYPE):
     if id_type == "email":
         return user.email()
 
     if id_type == "oauth":
         """A workaround implementation for getting userid."""
-        auth = os.getenv('HTTP_AUTHORIZATION')
-        bearer, token = auth.split()
-        token_type = 'id_token'
-        if 'OAUTH_USER_ID' in os.environ:
-            token_type = 'access_token'
-        url = ('https://www.googleapis.com/oauth2/v1/tokeninfo?%s=%s'
-               % (token_type, token))
-        user = {}
-        wait = 1
-        for i in range(3):
-            resp = urlfetch.fetch(url)
-            if resp.status_code == 200:
-                user = json.loads(resp.content)
-                break
-            elif resp.status_code == 400 and 'invalid_token' in resp.content:
-                url = ('https://www.googleapis.com/oauth2/v1/tokeninfo?%s=%s'
-                       % ('access_token', token))
-            else:
-                time.sleep(wait)
-                wait = wait + i
-        return user.get('user_id', '')
+        return _getOAuthUserId()
 
     if id_type == "custom":
-        # implement your own user_id creation and getting algorythm
-        # this is just a sample that queries datastore for an existing profile
-        # and generates an id if profile does not exist for an email
-        profile = Conference.query(Conference.mainEmail == user.email())
-        if profile:
-            return profile.id()
-        else:
-            return str(uuid.uuid1().get_hex())
+        # user ids are stored in UserIdentity entities keyed by the
+        # normalized email, so resolving one is a cached key lookup
+        return _getCustomUserId(user.email())
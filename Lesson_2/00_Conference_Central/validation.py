@@ -0,0 +1,85 @@
+#!/usr/bin/env python
+
+"""validation.py
+
+Udacity conference server-side Python App Engine validation of new
+Conference and Session values, shared by the API and the bulk import
+
+"""
+
+from utils import calendarBuckets
+from utils import parseDate
+
+DEFAULTS = {
+            "city": "Default City",
+            "maxAttendees": 0,
+            "seatsAvailable": 0,
+            "topics": [ "Default", "Topic" ],
+            }
+
+SESSION_DEFAULTS = {
+            "highlights": ["Default", "highlights"],
+            "speaker": "Default speaker",
+            "duration": 0,
+            "type_of_session": "default type",
+            "start_time": 0
+            }
+
+CONFERENCE_FIELDS = ('name', 'description', 'organizerUserId', 'topics',
+    'city', 'startDate', 'month', 'maxAttendees', 'seatsAvailable',
+    'endDate')
+
+SESSION_FIELDS = ('name', 'highlights', 'date', 'start_time', 'duration',
+    'speaker', 'type_of_session')
+
+
+def conferenceData(fields):
+    """Return the property values of a new Conference.
+
+    fields maps ConferenceForm field names to values; other names are
+    ignored. Raises ValueError if a field is missing or malformed.
+    """
+    data = dict((name, fields.get(name)) for name in CONFERENCE_FIELDS)
+    if not data['name']:
+        raise ValueError("Conference 'name' field required")
+
+    # add default values for those missing
+    for df in DEFAULTS:
+        if data[df] in (None, []):
+            data[df] = DEFAULTS[df]
+
+    # convert dates from strings to Date objects; set month and the
+    # calendar bucket properties based on start_date
+    if data['startDate']:
+        data['startDate'] = parseDate(data['startDate'])
+    data.update(calendarBuckets(data['startDate']))
+    if data['endDate']:
+        data['endDate'] = parseDate(data['endDate'])
+
+    # set seatsAvailable to be same as maxAttendees on creation
+    if data['maxAttendees'] > 0:
+        data['seatsAvailable'] = data['maxAttendees']
+    return data
+
+
+def sessionData(fields, conf):
+    """Return the property values of a new Session of Conference conf.
+
+    fields maps SessionForm field names to values; other names are
+    ignored. Raises ValueError if a field is missing or malformed.
+    """
+    data = dict((name, fields.get(name)) for name in SESSION_FIELDS)
+    if not data['name']:
+        raise ValueError("Session 'name' field required.")
+
+    # fill in default values for missing fields
+    for df in SESSION_DEFAULTS:
+        if data[df] in (None, []):
+            data[df] = SESSION_DEFAULTS[df]
+
+    # sessions without a date take place on the conference start date
+    if data['date']:
+        data['date'] = parseDate(data['date'])
+    else:
+        data['date'] = conf.startDate
+    return data